@@ -238,6 +238,10 @@ def build_condition_layer(geojson: dict) -> list:
         "bad": "#a83a2f",
     }
 
+    # Section thumbnails live in the collection's "images" map, keyed by
+    # str(representative_frame_index); older cached results embed them per feature
+    images = geojson.get("images", {})
+
     layers = []
     for feature in geojson.get("features", []):
         props = feature.get("properties", {})
@@ -262,7 +266,10 @@ def build_condition_layer(geojson: dict) -> list:
 
             # Build popup as Dash components (not HTML strings)
             popup_children = []
-            rep_image = props.get("representative_image", "")
+            rep_image = (
+                images.get(str(props.get("representative_frame_index")), "")
+                or props.get("representative_image", "")
+            )
             if rep_image:
                 popup_children.append(
                     html.Img(
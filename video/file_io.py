@@ -0,0 +1,76 @@
+"""File and JSON output helpers shared by the video pipeline modules.
+
+orjson is optional: when it is installed, JSON goes through it (several
+times faster on the coordinate-heavy GeoJSON and cache payloads); otherwise
+the stdlib json module is used with the same results.
+"""
+
+import json
+import os
+import tempfile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Write data to path atomically, so an interrupted run never leaves a
+    truncated file behind (temp file in the same directory + os.replace).
+
+    The temp file is unique per call, so concurrent writers (e.g. two Dash
+    requests saving the same output file) never share one.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            os.fchmod(f.fileno(), 0o644)  # mkstemp creates files 0600
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def dumps_json(obj, indent: bool = False) -> bytes:
+    """Serialise obj to UTF-8 JSON bytes, indented by 2 spaces if indent."""
+    if orjson is None:
+        return json.dumps(obj, indent=2 if indent else None).encode()
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, option=option)
+
+
+def loads_json(data: str | bytes):
+    """Parse JSON text or bytes.
+
+    Input orjson rejects is handed to json.loads, so what parses (e.g. NaN)
+    and the json.JSONDecodeError raised match the stdlib either way.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+
+def write_json(path: str, obj, indent: bool = False) -> None:
+    """Write obj to path as JSON, atomically."""
+    write_atomic(path, dumps_json(obj, indent=indent))
+
+
+def write_text(path: str, text: str) -> None:
+    """Write text to path as UTF-8, atomically."""
+    write_atomic(path, text.encode())
+
+
+def read_json(path: str):
+    """Read JSON from path."""
+    with open(path, "rb") as f:
+        return loads_json(f.read())
@@ -1,22 +1,67 @@
 """GPX parsing and GPS-to-frame matching utilities."""
 
-import math
+from math import atan2, cos, radians, sin, sqrt
 import os
 import xml.etree.ElementTree as ET
 from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+import numpy as np
 
 
 GPX_NS = "{http://www.topografix.com/GPX/1/1}"
 
 
+class TrackIndex(NamedTuple):
+    """Trackpoints prepared once for repeated match_frames_to_gps calls.
+
+    epochs holds each trackpoint's UTC epoch seconds (None where untimed).
+    times/lat/lon/ele are float arrays, set only when every trackpoint is
+    timed and in time order (the binary-search fast path); else None.
+    """
+
+    epochs: list[float | None]
+    times: np.ndarray | None
+    lat: np.ndarray | None
+    lon: np.ndarray | None
+    ele: np.ndarray | None
+
+
 def haversine(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """Return distance in metres between two GPS coordinates."""
     R = 6_371_000  # Earth radius in metres
-    rlat1, rlat2 = math.radians(lat1), math.radians(lat2)
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat / 2) ** 2 + math.cos(rlat1) * math.cos(rlat2) * math.sin(dlon / 2) ** 2
-    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    rlat1, rlat2 = radians(lat1), radians(lat2)
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(rlat1) * cos(rlat2) * sin(dlon / 2) ** 2
+    return R * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def haversine_vec(
+    lat1: np.ndarray,
+    lon1: np.ndarray,
+    lat2: np.ndarray,
+    lon2: np.ndarray,
+) -> np.ndarray:
+    """Vectorised haversine — element-wise distance in metres between coordinate arrays.
+
+    Same formula as haversine(), evaluated over whole NumPy arrays in one pass.
+    """
+    R = 6_371_000  # Earth radius in metres
+    rlat1, rlat2 = np.radians(lat1), np.radians(lat2)
+    dlat = np.radians(lat2 - lat1)
+    dlon = np.radians(lon2 - lon1)
+    a = np.sin(dlat / 2) ** 2 + np.cos(rlat1) * np.cos(rlat2) * np.sin(dlon / 2) ** 2
+    return R * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def polyline_length_km(lats, lons) -> float:
+    """Total haversine length in km of the polyline through (lats[i], lons[i])."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    if len(lats) < 2:
+        return 0.0
+    return float(haversine_vec(lats[:-1], lons[:-1], lats[1:], lons[1:]).sum()) / 1000
 
 
 def parse_gpx(gpx_path: str) -> list[dict]:
@@ -123,6 +168,8 @@ def match_frames_to_gps(
     trackpoints: list[dict],
     video_start_time: str = None,
     utc_offset_hours: int = 3,
+    time_offset_sec: float = 0.0,
+    track_index: TrackIndex | None = None,
 ) -> list[dict]:
     """Match each frame to a GPS coordinate by timestamp interpolation.
 
@@ -131,6 +178,11 @@ def match_frames_to_gps(
         trackpoints: output from parse_gpx()
         video_start_time: local time string "2026-02-12 14:18:00" (optional)
         utc_offset_hours: local timezone offset from UTC (Uganda = 3)
+        time_offset_sec: subtracted from each frame's timestamp_sec, e.g. the
+            clip's first timestamp to match a clip's frames against its own
+            start time without rewriting their cumulative timestamps.
+        track_index: build_track_index(trackpoints), to reuse across calls
+            that match against the same trackpoints (e.g. one call per clip).
 
     Returns: frames list with added lat, lon, elevation keys.
     """
@@ -148,19 +200,20 @@ def match_frames_to_gps(
         # Use first trackpoint time (already UTC) + offset as approximate start
         start_utc = trackpoints[0]["time"]
 
-    # Pre-compute trackpoint UTC timestamps in seconds since epoch
-    tp_times = []
-    for tp in trackpoints:
-        if tp["time"] is not None:
-            tp_times.append(tp["time"].timestamp())
-        else:
-            tp_times.append(None)
+    if track_index is None:
+        track_index = build_track_index(trackpoints)
 
     start_epoch = start_utc.timestamp()
 
+    # Common case — every trackpoint timed, in time order: locate all frames
+    # with one binary search instead of scanning the track per frame
+    if frames and track_index.times is not None:
+        _interpolate_gps_sorted(frames, trackpoints, track_index, start_epoch, time_offset_sec)
+        return frames
+
     for frame in frames:
-        frame_epoch = start_epoch + frame["timestamp_sec"]
-        lat, lon, ele = _interpolate_gps(frame_epoch, trackpoints, tp_times)
+        frame_epoch = start_epoch + (frame["timestamp_sec"] - time_offset_sec)
+        lat, lon, ele = _interpolate_gps(frame_epoch, trackpoints, track_index.epochs)
         frame["lat"] = lat
         frame["lon"] = lon
         frame["elevation"] = ele
@@ -168,6 +221,84 @@ def match_frames_to_gps(
     return frames
 
 
+def build_track_index(trackpoints: list[dict]) -> TrackIndex:
+    """Precompute trackpoint epochs and, when sorted, coordinate arrays."""
+    epochs = [tp["time"].timestamp() if tp["time"] is not None else None for tp in trackpoints]
+    # all(): no None (or 0.0, which the per-frame scan treats as missing)
+    if len(epochs) >= 2 and all(epochs):
+        times = np.asarray(epochs, dtype=np.float64)
+        if (np.diff(times) >= 0).all():
+            return TrackIndex(
+                epochs,
+                times,
+                np.array([tp["lat"] for tp in trackpoints], dtype=np.float64),
+                np.array([tp["lon"] for tp in trackpoints], dtype=np.float64),
+                np.array(
+                    [tp["elevation"] if tp["elevation"] is not None else np.nan for tp in trackpoints],
+                    dtype=np.float64,
+                ),
+            )
+    return TrackIndex(epochs, None, None, None, None)
+
+
+def _interpolate_gps_sorted(
+    frames: list[dict],
+    trackpoints: list[dict],
+    track_index: TrackIndex,
+    start_epoch: float,
+    time_offset_sec: float,
+) -> None:
+    """Vectorised _interpolate_gps for time-sorted, fully timed trackpoints.
+
+    Sets lat, lon and elevation on each frame exactly as the per-frame scan
+    would: nearest trackpoint (first one on ties), interpolated towards its
+    closer neighbour with the fraction clamped to [0, 1].
+    """
+    times = track_index.times
+    n = len(times)
+    ts = np.fromiter((f["timestamp_sec"] for f in frames), dtype=np.float64, count=len(frames))
+    target = start_epoch + (ts - time_offset_sec)
+
+    # Nearest trackpoint: the first at or after target, or the last before it
+    # (whichever is closer, earlier on ties); both as first of equal times
+    after = np.searchsorted(times, target, side="left")
+    before = np.searchsorted(times, times[np.maximum(after - 1, 0)], side="left")
+    after_c = np.minimum(after, n - 1)
+    use_before = (after == n) | (
+        (after > 0) & (np.abs(times[before] - target) <= np.abs(times[after_c] - target))
+    )
+    best = np.where(use_before, before, after_c)
+
+    # Neighbour on the side closer to target
+    prev_diff = np.abs(times[np.maximum(best - 1, 0)] - target)
+    next_diff = np.abs(times[np.minimum(best + 1, n - 1)] - target)
+    neighbor = np.where(prev_diff < next_diff, best - 1, best + 1)
+    neighbor = np.where(best == 0, 1, np.where(best == n - 1, n - 2, neighbor))
+
+    t1 = times[best]
+    t2 = times[neighbor]
+    same_time = t1 == t2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = np.maximum(0.0, np.minimum(1.0, (target - t1) / (t2 - t1)))
+
+    lats, lons, eles = track_index.lat, track_index.lon, track_index.ele
+    lat = (lats[best] + frac * (lats[neighbor] - lats[best])).tolist()
+    lon = (lons[best] + frac * (lons[neighbor] - lons[best])).tolist()
+    ele = eles[best] + frac * (eles[neighbor] - eles[best])
+    has_ele = ~(np.isnan(eles[best]) | np.isnan(eles[neighbor]))
+
+    for i, (frame, b) in enumerate(zip(frames, best.tolist())):
+        if same_time[i]:
+            tp = trackpoints[b]
+            frame["lat"] = tp["lat"]
+            frame["lon"] = tp["lon"]
+            frame["elevation"] = tp["elevation"]
+        else:
+            frame["lat"] = lat[i]
+            frame["lon"] = lon[i]
+            frame["elevation"] = float(ele[i]) if has_ele[i] else None
+
+
 def _interpolate_gps(
     target_epoch: float,
     trackpoints: list[dict],
@@ -1,14 +1,18 @@
-"""Pipeline validator — 12 checks on GeoJSON output.
+"""Pipeline validator — 12 checks on GeoJSON output, plus unit checks.
 
 Run with: python -m video.test_pipeline
+Unit checks only (no test videos needed): python -m video.test_pipeline --unit
 """
 
+import contextlib
+import io
 import json
 import math
 import os
 import sys
 import tempfile
 import time
+from types import SimpleNamespace
 
 BASE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 VIDEO_DIR = os.path.join(BASE, "data", "videos", "demo2_kasangati_loop", "clips_compressed")
@@ -153,17 +157,18 @@ def run_checks(geojson: dict, pipeline_result: dict = None) -> int:
     else:
         print(f"[FAIL] 8. Temporal order: Indices {indices[:10]}... expected {expected[:10]}...")
 
-    # --- Check 9: POPUP HTML ---
+    # --- Check 9: POPUP IMAGE ---
+    # Popup thumbnails live in the collection's images map, keyed by representative frame
+    images = geojson.get("images", {})
     missing_popup = []
     for i, feat in enumerate(features):
-        popup = feat["properties"].get("popup_html", "")
-        if not popup or "<img" not in popup:
+        if not images.get(str(feat["properties"].get("representative_frame_index"))):
             missing_popup.append(i)
     if not missing_popup:
-        print(f"[PASS] 9. Popup HTML: All features have popup_html with <img> tag")
+        print(f"[PASS] 9. Popup image: All features have a representative image for the popup")
         passed += 1
     else:
-        print(f"[FAIL] 9. Popup HTML: {len(missing_popup)} features missing popup with <img>: "
+        print(f"[FAIL] 9. Popup image: {len(missing_popup)} features missing a representative image: "
               f"sections {missing_popup[:5]}")
 
     # --- Check 10: TOTAL DISTANCE ---
@@ -246,6 +251,234 @@ def run_checks(geojson: dict, pipeline_result: dict = None) -> int:
     return passed
 
 
+def _report(label: str, ok: bool, detail: str) -> int:
+    """Print a [PASS]/[FAIL] line; returns 1 on pass for the running count."""
+    print(f"[{'PASS' if ok else 'FAIL'}] {label}: {detail}")
+    return int(ok)
+
+
+def run_file_io_checks() -> tuple[int, int]:
+    """Checks on video.file_io (JSON fallback, atomic writes). Returns (passed, total)."""
+    from video import file_io
+
+    passed = 0
+    total = 4
+    sample = {"route": "Kasangati loop", "iri": [3.5, 8.0, 12], "sections": {"0": None}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "summary.json")
+
+        # --- Check F1: STDLIB FALLBACK WITHOUT ORJSON ---
+        saved_orjson = file_io.orjson
+        file_io.orjson = None
+        try:
+            file_io.write_json(path, sample, indent=True)
+            with open(path) as f:
+                text = f.read()
+            ok = json.loads(text) == sample and file_io.read_json(path) == sample and "\n  " in text
+        finally:
+            file_io.orjson = saved_orjson
+        passed += _report("F1. JSON without orjson", ok, "stdlib write/read round-trips, indented")
+
+        # --- Check F2: SAME RESULT WITH OR WITHOUT ORJSON ---
+        loaded = file_io.read_json(path)
+        nan = file_io.loads_json("[NaN]")[0]
+        ok = loaded == sample and nan != nan
+        try:
+            file_io.loads_json("{bad")
+            ok = False
+        except json.JSONDecodeError:
+            pass
+        backend = "orjson" if file_io.orjson is not None else "json"
+        passed += _report("F2. JSON parsing", ok, f"{backend} reads the file; NaN and bad input behave like json")
+
+        # --- Check F3: FAILED WRITE KEEPS THE OLD FILE ---
+        file_io.write_json(path, sample)
+        try:
+            file_io.write_atomic(path, "not bytes")  # fails inside the temp-file write
+            ok = False
+        except TypeError:
+            ok = file_io.read_json(path) == sample and os.listdir(tmp) == ["summary.json"]
+        passed += _report("F3. Failed write", ok, "old file intact, no temp file left")
+
+        # --- Check F4: FAILED REPLACE LEAVES NO PARTIAL FILE ---
+        new_path = os.path.join(tmp, "condition.geojson")
+        real_replace = file_io.os.replace
+
+        def failing_replace(src, dst):
+            raise OSError("simulated rename failure")
+
+        file_io.os.replace = failing_replace
+        try:
+            file_io.write_json(new_path, sample)
+            ok = False
+        except OSError:
+            ok = os.listdir(tmp) == ["summary.json"]
+        finally:
+            file_io.os.replace = real_replace
+        passed += _report("F4. Failed replace", ok, "no partial or temp file created")
+
+    return passed, total
+
+
+class _FakeVisionClient:
+    """Stand-in anthropic.Anthropic that counts vision requests.
+
+    Each reply carries the request number as its IRI, so results show which
+    call produced them. Batch results for the frames in *fail_batch_ids*
+    come back errored.
+    """
+
+    def __init__(self, fail_batch_ids: tuple = ()):
+        self.calls = 0
+        self.polls = 0
+        self.fail_batch_ids = fail_batch_ids
+        self.api_key, self.auth_token, self.base_url = "test", None, "http://localhost"
+        self.timeout, self.max_retries = 10, 0
+        self.messages = SimpleNamespace(create=self._create, batches=SimpleNamespace(
+            create=self._batch_create, retrieve=self._batch_retrieve, results=self._batch_results,
+        ))
+        self._batch_requests = []
+
+    def _reply(self) -> SimpleNamespace:
+        self.calls += 1
+        text = json.dumps({
+            "surface_type": "gravel", "condition_class": "poor",
+            "iri_estimate": self.calls, "distress_types": ["pothole"],
+        })
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+    def _create(self, **kwargs):
+        return self._reply()
+
+    async def acreate(self, **kwargs):
+        return self._reply()
+
+    def _batch_create(self, requests):
+        self._batch_requests = requests
+        return SimpleNamespace(id="batch_1")
+
+    def _batch_retrieve(self, batch_id):
+        self.polls += 1
+        counts = SimpleNamespace(succeeded=0, errored=0, canceled=0, expired=0, processing=len(self._batch_requests))
+        status = "ended" if self.polls > 1 else "in_progress"
+        return SimpleNamespace(processing_status=status, request_counts=counts)
+
+    def _batch_results(self, batch_id):
+        for request in self._batch_requests:
+            if request["custom_id"] in self.fail_batch_ids:
+                result = SimpleNamespace(type="errored")
+            else:
+                result = SimpleNamespace(type="succeeded", message=self._reply())
+            yield SimpleNamespace(custom_id=request["custom_id"], result=result)
+
+
+class _FakeAsyncVisionClient:
+    """Stand-in anthropic.AsyncAnthropic routing requests to one _FakeVisionClient."""
+
+    sync_client = None
+
+    def __init__(self, **kwargs):
+        self.messages = SimpleNamespace(create=self.sync_client.acreate)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return None
+
+
+def run_assessment_cache_checks() -> tuple[int, int]:
+    """Checks on assess_road's in-run dedupe, per-frame cache and batch path. Returns (passed, total)."""
+    import cv2
+    import numpy as np
+    from video import vision_assess
+
+    passed = 0
+    total = 5
+
+    # Four distinct JPEGs; the first three repeat as a parked vehicle's would
+    images = [
+        cv2.imencode(".jpg", np.full((48, 64, 3), shade, dtype=np.uint8))[1].tobytes()
+        for shade in (40, 120, 200, 0)
+    ]
+    route = [0, 1, 0, 2, 1, 0]
+
+    def assess(client, order: list[int] = route, **kwargs) -> list[dict]:
+        frames = [{"image_bytes": images[i], "frame_index": n} for n, i in enumerate(order)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = vision_assess.assess_road(frames, anthropic_client=client, delay=0, **kwargs)
+        return [f["assessment"] for f in result["frames"]]
+
+    # --- Check A1: IN-RUN DEDUPE, ONE BY ONE ---
+    client = _FakeVisionClient()
+    assessments = assess(client)
+    iris = [a["iri_estimate"] for a in assessments]
+    ok = (client.calls == 3 and iris == [1, 2, 1, 3, 2, 1]
+          and assessments[0] is not assessments[2])
+    passed += _report("A1. Duplicate frames", ok, f"{client.calls} API calls for 6 frames / 3 images")
+
+    # --- Check A2: IN-RUN DEDUPE, CONCURRENT ---
+    import anthropic
+    client = _FakeVisionClient()
+    _FakeAsyncVisionClient.sync_client = client
+    real_async = anthropic.AsyncAnthropic
+    anthropic.AsyncAnthropic = _FakeAsyncVisionClient
+    try:
+        iris = [a["iri_estimate"] for a in assess(client, concurrency=4)]
+    finally:
+        anthropic.AsyncAnthropic = real_async
+    ok = client.calls == 3 and iris[0] == iris[2] == iris[5] and iris[1] == iris[4]
+    passed += _report("A2. Duplicate frames (concurrent)", ok, f"{client.calls} API calls for 6 frames / 3 images")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # --- Check A3: CACHE HIT SKIPS THE API ---
+        first = assess(_FakeVisionClient(), cache_dir=cache_dir)
+        client = _FakeVisionClient()
+        second = assess(client, cache_dir=cache_dir)
+        ok = client.calls == 0 and second == first and len(os.listdir(cache_dir)) == 3
+        passed += _report("A3. Assessment cache", ok, f"re-run made {client.calls} API calls, "
+                          f"{len(os.listdir(cache_dir))} cache files")
+
+        # --- Check A4: CACHE MISSES ONLY FOR NEW IMAGES ---
+        client = _FakeVisionClient()
+        third = assess(client, route[:5] + [3], cache_dir=cache_dir)
+        ok = client.calls == 1 and third[:5] == first[:5]
+        passed += _report("A4. Cache with a new image", ok, f"{client.calls} API call for 1 unseen image")
+
+    # --- Check A5: BATCH PATH ---
+    client = _FakeVisionClient(fail_batch_ids=("frame_1",))
+    saved_poll = vision_assess.BATCH_POLL_START_SEC
+    vision_assess.BATCH_POLL_START_SEC = 0
+    try:
+        assessments = assess(client, use_batch=True)
+    finally:
+        vision_assess.BATCH_POLL_START_SEC = saved_poll
+    conditions = [a["condition_class"] for a in assessments]
+    default = vision_assess.DEFAULT_ASSESSMENT
+    ok = (len(client._batch_requests) == 3 and client.polls == 2 and client.calls == 2
+          and conditions[0] == conditions[2] == conditions[3] == "poor"
+          and assessments[1] == assessments[4] == default)
+    passed += _report("A5. Batch path", ok, f"{len(client._batch_requests)} batch requests, "
+                      f"{client.polls} polls, failed request falls back to the default")
+
+    return passed, total
+
+
+def run_unit_checks() -> bool:
+    """Run the checks that need no test data. Returns True if all pass."""
+    print("-" * 40)
+    print("UNIT CHECKS")
+    print("-" * 40)
+    passed = total = 0
+    for checks in (run_file_io_checks, run_assessment_cache_checks):
+        p, t = checks()
+        passed += p
+        total += t
+    print(f"{passed}/{total} unit checks passed")
+    return passed == total
+
+
 def main():
     """Run the pipeline and validate output."""
     print("=" * 50)
@@ -307,5 +540,9 @@ def main():
 
 
 if __name__ == "__main__":
+    units_ok = run_unit_checks()
+    if "--unit" in sys.argv:
+        sys.exit(0 if units_ok else 1)
+    print()
     passed = main()
-    sys.exit(0 if passed == 12 else 1)
+    sys.exit(0 if passed == 12 and units_ok else 1)
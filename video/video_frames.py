@@ -4,8 +4,26 @@ import base64
 import os
 import re
 import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import cv2
+import numpy as np
+
+# Dashcam filename pattern, e.g. 2026_02_12_144138_00.MP4
+_TS_RE = re.compile(r"(\d{4})_(\d{2})_(\d{2})_(\d{2})(\d{2})(\d{2})_\d+\.\w+")
+
+# VideoCapture open params: request hardware-accelerated decode if any is available
+_DECODE_PARAMS = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+# Sample intervals at least this long seek to each sample rather than decoding
+# every frame in between; shorter gaps usually sit inside one keyframe group,
+# where a seek would re-decode from the same keyframe each time
+SEEK_MIN_INTERVAL_SEC = 2.0
+
+# Default cap on clips decoded at once in directory mode. Each OpenCV/FFmpeg
+# decoder already runs its own threads and buffers, so more concurrent clips
+# mostly add CPU contention and memory
+EXTRACT_MAX_WORKERS = 3
 
 
 def extract_start_time_from_filename(filename: str) -> str | None:
@@ -13,42 +31,131 @@ def extract_start_time_from_filename(filename: str) -> str | None:
 
     Returns time string like "2026-02-12 14:41:38" or None if pattern doesn't match.
     """
-    match = re.match(r"(\d{4})_(\d{2})_(\d{2})_(\d{2})(\d{2})(\d{2})_\d+\.\w+", filename)
+    match = _TS_RE.match(filename)
     if match:
         y, mo, d, h, mi, s = match.groups()
         return f"{y}-{mo}-{d} {h}:{mi}:{s}"
     return None
 
 
+def frame_image_base64(frame: dict) -> str:
+    """Return the frame's JPEG as a base64 string, encoding lazily from image_bytes.
+
+    Frames from extract_frames() carry raw ``image_bytes``; older frame dicts
+    (e.g. loaded from cache) may carry ``image_base64`` directly.
+    """
+    if frame.get("image_base64"):
+        return frame["image_base64"]
+    image_bytes = frame.get("image_bytes")
+    if image_bytes:
+        return base64.b64encode(image_bytes).decode("ascii")
+    return ""
+
+
+def frame_image_bytes(frame: dict) -> bytes:
+    """Return the frame's raw JPEG bytes, decoding ``image_base64`` if that is all it has.
+
+    Cheaper than frame_image_base64 for hashing frames extracted in this run.
+    """
+    image_bytes = frame.get("image_bytes")
+    if image_bytes:
+        return image_bytes
+    image_base64 = frame.get("image_base64")
+    if image_base64:
+        try:
+            return base64.b64decode(image_base64)
+        except ValueError:  # e.g. the "[cached]" placeholder
+            return image_base64.encode()
+    return b""
+
+
+def _write_frame_file(filename: str, data: bytes, dir_fd: int | None = None) -> None:
+    """Write data to filename with a single unbuffered open/write/close.
+
+    When dir_fd is given, filename is resolved relative to that directory
+    descriptor, avoiding a full path lookup per frame.
+    """
+    fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644, dir_fd=dir_fd)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def _iter_sampled_frames(cap, frame_skip: int, total_frames: int, seek: bool):
+    """Yield (frame_num, BGR frame) for every frame_skip-th frame of cap.
+
+    With seek, each sample is reached via CAP_PROP_POS_FRAMES: the backend
+    jumps to the preceding keyframe and decodes forward from there only.
+    Without it (or once the container's frame count is exhausted, or a seek
+    is refused) every frame is grab()bed and only kept ones retrieve()d.
+
+    Frames are decoded into one reused array, so each yielded frame is only
+    valid until the next one is requested.
+    """
+    pos = 0  # frame number the next grab() returns
+    frame = None
+    if seek and total_frames > 0:
+        target = 0
+        while target < total_frames:
+            if target != pos and not cap.set(cv2.CAP_PROP_POS_FRAMES, target):
+                break
+            pos = target
+            ret, frame = cap.read(frame)
+            if not ret:
+                return
+            yield pos, frame
+            pos += 1
+            target += frame_skip
+
+    # Linear decode; also picks up frames past an undercounted frame count
+    while cap.grab():
+        if pos % frame_skip == 0:
+            ret, frame = cap.retrieve(frame)
+            if not ret:
+                return
+            yield pos, frame
+        pos += 1
+
+
 def _extract_from_single_file(
     video_path: str,
     interval_seconds: int,
-    output_dir: str,
+    output_dir: str | None,
     max_width: int,
     frame_offset: int = 0,
     cumulative_time: float = 0.0,
     clip_index: int | None = None,
     total_clips: int | None = None,
+    verbose: bool = True,
 ) -> tuple[list[dict], float]:
     """Extract frames from a single video file.
 
     Args:
         video_path: path to video file
         interval_seconds: seconds between frame samples
-        output_dir: directory to save frames
+        output_dir: directory to save frames, or None to keep JPEGs in memory only
         max_width: resize frames to this max width
         frame_offset: starting frame_index counter (for multi-clip)
         cumulative_time: cumulative seconds offset (for multi-clip)
         clip_index: 0-based clip index (for progress display)
         total_clips: total number of clips (for progress display)
+        verbose: print a progress line per extracted frame
 
     Returns:
         (frames_list, clip_duration_seconds)
     """
-    cap = cv2.VideoCapture(video_path)
+    # Let the backend decode (and colour-convert) on the GPU where available;
+    # OpenCV falls back to software decode silently when it isn't.
+    cap = cv2.VideoCapture(video_path, cv2.CAP_ANY, _DECODE_PARAMS)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         raise RuntimeError(f"Cannot open video: {video_path}")
 
+    dir_fd = None
     try:
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
@@ -58,58 +165,76 @@ def _extract_from_single_file(
         expected = int(duration_sec // interval_seconds) + 1
         clip_label = f"[Clip {clip_index + 1}/{total_clips}] " if clip_index is not None else ""
 
-        results = []
-        frame_num = 0
-        extracted = 0
+        # Per-clip constants — parsed once, not per kept frame
+        clip_basename = os.path.basename(video_path)
+        clip_ts = extract_start_time_from_filename(clip_basename)
+        clip_fields = {"clip_filename": clip_basename}
+        if clip_ts:
+            # Clip start time from filename, when available
+            clip_fields["clip_timestamp"] = clip_ts
+            clip_fields["video_start_time"] = clip_ts
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        # Hold the output directory open so per-frame writes skip path resolution
+        if output_dir is not None and os.open in os.supports_dir_fd:
+            dir_fd = os.open(output_dir, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
 
-            if frame_num % frame_skip == 0:
-                local_ts = frame_num / fps
-                cumulative_ts = cumulative_time + local_ts
+        # Resize output reused across kept frames (size is fixed per clip)
+        resize_buf = None
 
-                # Resize preserving aspect ratio
-                h, w = frame.shape[:2]
-                if w > max_width:
-                    scale = max_width / w
-                    frame = cv2.resize(frame, (max_width, int(h * scale)))
+        # Sized from the container's frame count; grown below if that undercounts
+        results: list[dict | None] = [None] * expected
+        extracted = 0
 
-                # Save as JPEG
-                global_idx = frame_offset + extracted
+        seek = interval_seconds >= SEEK_MIN_INTERVAL_SEC
+        for frame_num, frame in _iter_sampled_frames(cap, frame_skip, total_frames, seek):
+            local_ts = frame_num / fps
+            cumulative_ts = cumulative_time + local_ts
+
+            # Resize preserving aspect ratio
+            h, w = frame.shape[:2]
+            if w > max_width:
+                scale = max_width / w
+                target_h = int(h * scale)
+                if resize_buf is None or resize_buf.shape[0] != target_h:
+                    resize_buf = np.empty((target_h, max_width) + frame.shape[2:], dtype=frame.dtype)
+                frame = cv2.resize(frame, (max_width, target_h), dst=resize_buf)
+
+            # Encode JPEG once in memory, then save the same bytes
+            global_idx = frame_offset + extracted
+            _, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            image_bytes = buf.tobytes()
+            image_path = None
+            if output_dir is not None:
                 filename = f"frame_{global_idx:03d}.jpg"
                 image_path = os.path.join(output_dir, filename)
-                cv2.imwrite(image_path, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-
-                # Base64 encode
-                with open(image_path, "rb") as f:
-                    image_base64 = base64.b64encode(f.read()).decode("utf-8")
+                if dir_fd is not None:
+                    _write_frame_file(filename, image_bytes, dir_fd=dir_fd)
+                else:
+                    _write_frame_file(image_path, image_bytes)
 
+            if verbose:
                 mins, secs = divmod(int(cumulative_ts), 60)
                 print(f"  {clip_label}Extracted frame {extracted + 1}/{expected} at {mins}:{secs:02d} (cumulative)")
 
-                frame_data = {
-                    "frame_index": global_idx,
-                    "timestamp_sec": cumulative_ts,
-                    "image_path": image_path,
-                    "image_base64": image_base64,
-                    "clip_filename": os.path.basename(video_path),
-                }
-
-                # Add clip start time from filename if available
-                clip_ts = extract_start_time_from_filename(os.path.basename(video_path))
-                if clip_ts:
-                    frame_data["clip_timestamp"] = clip_ts
-                    frame_data["video_start_time"] = clip_ts
-
+            frame_data = {
+                "frame_index": global_idx,
+                "timestamp_sec": cumulative_ts,
+                "image_path": image_path,
+                "image_bytes": image_bytes,
+                **clip_fields,
+            }
+
+            if extracted < expected:
+                results[extracted] = frame_data
+            else:
                 results.append(frame_data)
-                extracted += 1
+            extracted += 1
 
-            frame_num += 1
+        del results[extracted:]
     finally:
         cap.release()
+        if dir_fd is not None:
+            os.close(dir_fd)
 
     return results, duration_sec
 
@@ -119,6 +244,9 @@ def extract_frames(
     interval_seconds: int = 5,
     output_dir: str = None,
     max_width: int = 1280,
+    verbose: bool = True,
+    save_files: bool = True,
+    max_workers: int | None = None,
 ) -> list[dict]:
     """Extract frames from video at interval.
 
@@ -129,22 +257,36 @@ def extract_frames(
         interval_seconds: seconds between frame samples
         output_dir: directory to save extracted frame images
         max_width: resize frames to this max width
-
-    Returns list of dicts with frame_index, timestamp_sec, image_path, image_base64,
-    clip_filename, and optionally clip_timestamp/video_start_time.
+        verbose: print a progress line per extracted frame (in directory
+            mode, per clip as each finishes; set False from a UI callback)
+        save_files: write each frame to output_dir as a JPEG. When False,
+            nothing touches disk and image_path is None on every frame.
+        max_workers: clips decoded concurrently in directory mode (default:
+            up to EXTRACT_MAX_WORKERS, never more than the CPU count). 1
+            extracts clips one by one. Each extra worker holds another open
+            decoder with its own threads and full-resolution frame buffers,
+            and in parallel the frame files are only written once the last
+            clip finishes, so keep this low on machines short of memory.
+
+    Returns list of dicts with frame_index, timestamp_sec, image_path, image_bytes
+    (raw JPEG — see frame_image_base64), clip_filename, and optionally
+    clip_timestamp/video_start_time.
     """
-    if output_dir is None:
-        output_dir = "/tmp/tara_frames"
+    if not save_files:
+        output_dir = None
+    else:
+        if output_dir is None:
+            output_dir = "/tmp/tara_frames"
 
-    # Clear and recreate output dir
-    if os.path.exists(output_dir):
-        shutil.rmtree(output_dir)
-    os.makedirs(output_dir, exist_ok=True)
+        # Clear and recreate output dir
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
 
     # Single file mode
     if os.path.isfile(video_path):
         frames, _ = _extract_from_single_file(
-            video_path, interval_seconds, output_dir, max_width,
+            video_path, interval_seconds, output_dir, max_width, verbose=verbose,
         )
         return frames
 
@@ -162,6 +304,14 @@ def extract_frames(
 
     print(f"  Found {len(mp4_files)} video clips in {video_path}")
 
+    if max_workers is None:
+        max_workers = min(len(mp4_files), os.cpu_count() or 1, EXTRACT_MAX_WORKERS)
+    if max_workers > 1 and len(mp4_files) > 1:
+        return _extract_clips_parallel(
+            [os.path.join(video_path, mp4) for mp4 in mp4_files],
+            interval_seconds, output_dir, max_width, max_workers, verbose,
+        )
+
     all_frames = []
     cumulative_time = 0.0
     frame_offset = 0
@@ -174,9 +324,61 @@ def extract_frames(
             cumulative_time=cumulative_time,
             clip_index=i,
             total_clips=len(mp4_files),
+            verbose=verbose,
         )
         all_frames.extend(frames)
         frame_offset += len(frames)
         cumulative_time += clip_duration
 
     return all_frames
+
+
+def _extract_clips_parallel(
+    clip_paths: list[str],
+    interval_seconds: int,
+    output_dir: str | None,
+    max_width: int,
+    max_workers: int,
+    verbose: bool,
+) -> list[dict]:
+    """Decode clips concurrently, then number, time and save frames in clip order.
+
+    OpenCV releases the GIL while decoding and encoding, so threads overlap
+    the per-clip work. Each clip is extracted in memory as if it were the
+    first, and reported as soon as it finishes (per-frame times are then
+    clip-local). frame_index, timestamp_sec and the frame files are
+    assigned once all clips are done, from the preceding clips' frame
+    counts and durations, giving the same result as sequential extraction.
+    """
+    total_clips = len(clip_paths)
+    per_clip: list[tuple[list[dict], float] | None] = [None] * total_clips
+
+    def extract(clip_path: str) -> tuple[list[dict], float]:
+        return _extract_from_single_file(clip_path, interval_seconds, None, max_width, verbose=False)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(extract, clip_path): i for i, clip_path in enumerate(clip_paths)}
+        for future in as_completed(futures):
+            i = futures[future]
+            frames, clip_duration = per_clip[i] = future.result()
+            if verbose:
+                clip_label = f"[Clip {i + 1}/{total_clips}]"
+                for n, frame in enumerate(frames, 1):
+                    mins, secs = divmod(int(frame["timestamp_sec"]), 60)
+                    print(f"  {clip_label} Extracted frame {n}/{len(frames)} at {mins}:{secs:02d} (clip time)")
+                print(f"  {clip_label} Extracted {len(frames)} frames")
+
+    all_frames = []
+    cumulative_time = 0.0
+    for frames, clip_duration in per_clip:
+        for frame in frames:
+            frame["frame_index"] += len(all_frames)
+            frame["timestamp_sec"] = cumulative_time + frame["timestamp_sec"]
+            if output_dir is not None:
+                image_path = os.path.join(output_dir, f"frame_{frame['frame_index']:03d}.jpg")
+                _write_frame_file(image_path, frame["image_bytes"])
+                frame["image_path"] = image_path
+        all_frames.extend(frames)
+        cumulative_time += clip_duration
+
+    return all_frames
@@ -1,16 +1,209 @@
 """Map output and condition narrative generation."""
 
+import asyncio
 from collections import Counter
 from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from itertools import chain
 
-from video.gps_utils import haversine, get_trackpoints_between
+import numpy as np
 
-CONDITION_COLORS = {
+from video.gps_utils import haversine_vec
+from video.video_frames import frame_image_base64
+
+
+class _ColorTable(dict):
+    """Condition -> colour dict that answers unknown conditions with the "fair" colour.
+
+    Unlike defaultdict, a miss does not insert the key.
+    """
+
+    def __missing__(self, key):
+        return "#9a6b2f"
+
+
+CONDITION_COLORS = _ColorTable({
     "good": "#2d5f4a",
     "fair": "#9a6b2f",
     "poor": "#c4652a",
     "bad": "#a83a2f",
-}
+})
+
+# Popup HTML templates — static markup. The stats body is cached per distinct
+# assessment; only the thumbnail differs between otherwise identical popups.
+_POPUP_OPEN = '<div style="font-family: \'Source Sans 3\', sans-serif; max-width: 320px;">\n'
+_POPUP_BODY_TPL = (
+    '<div style="margin-top:8px;">'
+    '<span style="background:{color}; color:white; padding:2px 8px; '
+    'border-radius:2px; font-size:11px; font-weight:600;">'
+    '{condition}</span>'
+    '<span style="color:#5c5950; font-size:12px; margin-left:8px;">'
+    'IRI ~{iri} m/km</span>'
+    '</div>\n'
+    '<div style="font-size:12px; color:#2c2a26; margin-top:6px;">'
+    '{surface} surface &middot; {distress}'
+    '</div>\n'
+    '{notes_block}'
+)
+_POPUP_CLOSE = '</div>'
+_POPUP_IMG_TPL = (
+    '<img src="data:image/jpeg;base64,{img}" '
+    'style="width:300px; border-radius:3px;" />\n'
+)
+_POPUP_NOTES_TPL = '<div style="font-size:11px; color:#8a8578; margin-top:4px;">{notes}</div>\n'
+_POPUP_EQUITY_TPL = (
+    '<div style="margin-top:6px;padding:4px 8px;background:{color}15;'
+    'border-left:3px solid {color};font-size:11px;">'
+    '<b style="color:{color}">Equity: {concern}</b><br>'
+    '{land_use} area · Pedestrians: {pedestrians}{school}{footpath}'
+    '</div>\n'
+)
+
+
+_TZ_LOCAL = timezone(timedelta(hours=3))  # Uganda = UTC+3
+
+# Rankings used when aggregating activity profiles over a section
+_LEVEL_ORDER = {"high": 3, "moderate": 2, "low": 1, "none": 0, "unknown": -1}
+_PRESENCE_ORDER = {"many": 3, "some": 2, "few": 1, "none": 0}
+_FOOTPATH_ORDER = {"good": 2, "poor": 1, "none": 0}
+_VEHICLE_TYPES = ("boda_bodas", "bicycles", "minibus_taxi", "cars", "trucks")
+
+
+def _codes(values: list) -> np.ndarray:
+    """Integer code per value, equal codes for equal values (first seen gets 0)."""
+    table: dict = {}
+    return np.array([table.setdefault(v, len(table)) for v in values], dtype=np.int64)
+
+
+def _section_modes(ids: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    """Most frequent code in each section ids[starts[k]:starts[k + 1]].
+
+    Ties go to the code seen first within the section, matching
+    Counter(section).most_common(1)[0][0], for all sections at once.
+    """
+    n = len(ids)
+    section_ids = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    shape = (len(starts), int(ids.max()) + 1)
+    counts = np.zeros(shape, dtype=np.int64)
+    np.add.at(counts, (section_ids, ids), 1)
+    first_seen = np.full(shape, n, dtype=np.int64)
+    np.minimum.at(first_seen, (section_ids, ids), np.arange(n))
+    # Highest count wins; among equal counts the smallest first position
+    return (counts * (n + 1) - first_seen).argmax(axis=1)
+
+
+def _sustained(ids: np.ndarray, window: int) -> np.ndarray:
+    """True at i when ids[i:i + window] is a full window of one repeated value."""
+    n = len(ids)
+    out = np.zeros(n, dtype=bool)
+    m = n - window + 1
+    if m > 0:
+        out[:m] = True
+        for k in range(1, window):
+            out[:m] &= ids[k:k + m] == ids[:m]
+    return out
+
+
+def _time_index(epochs: list, lonlat: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Index timed [lon, lat] points for repeated time-window lookups.
+
+    Returns (order, sorted_epochs, lonlat) where order argsorts the epochs.
+    NaN epochs sort last and never fall inside a window.
+    """
+    epochs_arr = np.array(epochs, dtype=np.float64).reshape(-1)
+    order = np.argsort(epochs_arr, kind="stable")
+    return order, epochs_arr[order], np.array(lonlat, dtype=np.float64).reshape(-1, 2)
+
+
+def _points_between(index: tuple, start_epoch: float, end_epoch: float) -> np.ndarray:
+    """[lon, lat] rows with start_epoch <= epoch <= end_epoch, in original order."""
+    order, sorted_epochs, lonlat = index
+    lo = np.searchsorted(sorted_epochs, start_epoch, side="left")
+    hi = np.searchsorted(sorted_epochs, end_epoch, side="right")
+    return lonlat[np.sort(order[lo:hi])]
+
+
+def _lonlat_pairs(arr: np.ndarray) -> list[tuple[float, float]]:
+    """(lon, lat) tuples from an (N, 2) array — same JSON as nested lists, lighter objects."""
+    return list(zip(arr[:, 0].tolist(), arr[:, 1].tolist()))
+
+
+@lru_cache(maxsize=256)
+def _display_label(value: str) -> str:
+    """An enum-style value for display, underscores as spaces (e.g. "edge break")."""
+    return value.replace("_", " ")
+
+
+@lru_cache(maxsize=128)
+def _title_label(value: str) -> str:
+    """A surface / land-use value for display, e.g. "under_construction" -> "Under Construction"."""
+    return value.replace("_", " ").title()
+
+
+@lru_cache(maxsize=256)
+def _distress_label(distress: frozenset) -> str:
+    """Sorted, comma-joined distress types of a section, or "none"."""
+    return ", ".join(sorted(distress)) if distress else "none"
+
+
+def _segment_km(coords) -> np.ndarray:
+    """Great-circle length in km of each segment of a [[lon, lat], ...] polyline."""
+    arr = np.asarray(coords, dtype=np.float64)
+    if len(arr) < 2:
+        return np.zeros(0)
+    return haversine_vec(arr[:-1, 1], arr[:-1, 0], arr[1:, 1], arr[1:, 0]) / 1000
+
+
+def _densify_kernel(arr: np.ndarray, seg_km: np.ndarray, resolution_km: float) -> np.ndarray:
+    """Insert points so no segment of an (n, 2) [lon, lat] polyline exceeds resolution_km.
+
+    seg_km holds the segment lengths of arr. A long segment i is cut into
+    max(2, int(seg_km[i] / resolution_km) + 1) equal parts by linear
+    interpolation; short segments are left alone.
+    """
+    long_seg = seg_km > resolution_km
+    n_parts = np.maximum(2, (seg_km / resolution_km).astype(np.int64) + 1)
+    n_insert = np.where(long_seg, n_parts - 1, 0)
+
+    # Segment i gets n_insert[i] points at fractions j / n_parts[i], j = 1..n_insert[i]
+    seg_ids = np.repeat(np.arange(len(seg_km)), n_insert)
+    first_of_seg = np.cumsum(n_insert) - n_insert
+    j = np.arange(len(seg_ids)) - first_of_seg[seg_ids] + 1
+    frac = (j / n_parts[seg_ids])[:, None]
+    inserted = arr[seg_ids] + frac * (arr[seg_ids + 1] - arr[seg_ids])
+
+    # Original point i lands after the points inserted on segments 0..i-1
+    dense = np.empty((len(arr) + len(seg_ids), 2))
+    orig_pos = np.arange(len(arr))
+    orig_pos[1:] += np.cumsum(n_insert)
+    is_orig = np.zeros(len(dense), dtype=bool)
+    is_orig[orig_pos] = True
+    dense[orig_pos] = arr
+    dense[~is_orig] = inserted
+    return dense
+
+
+def _split_kernel(seg_km: np.ndarray, max_km: float) -> list[tuple[int, int, float]]:
+    """Cut a polyline into pieces of at most max_km (each piece keeps >= 1 segment).
+
+    seg_km holds the polyline's segment lengths. Returns (start, stop,
+    length_km) per piece, to slice as coords[start:stop]; consecutive pieces
+    share their boundary point.
+    """
+    seg_list = seg_km.tolist()
+    cum_km = np.concatenate(([0.0], np.cumsum(seg_km)))
+    n_points = len(cum_km)
+    pieces = []
+    i0 = 0
+    while n_points - i0 >= 2:
+        # First point past max_km from the piece start, but at least two segments on
+        i = max(int(np.searchsorted(cum_km, cum_km[i0] + max_km, side="right")), i0 + 2)
+        if i >= n_points:
+            pieces.append((i0, n_points, sum(seg_list[i0:])))
+            break
+        pieces.append((i0, i, sum(seg_list[i0:i - 1])))
+        i0 = i - 1
+    return pieces
 
 
 def aggregate_section_equity(section_frames: list[dict]) -> dict:
@@ -43,56 +236,63 @@ def aggregate_section_equity(section_frames: list[dict]) -> dict:
             "equity_concern": "unknown",
         }
 
-    # Most common land_use across frames
-    land_uses = [p.get("land_use", "unknown") for p in profiles]
-    dominant_land_use = max(set(land_uses), key=land_uses.count)
+    # One pass over the profiles. Ordered picks keep the first value with the
+    # best rank, matching max()/min() with a key function.
+    land_uses: Counter = Counter()
+    highest_activity, activity_rank = None, -2
+    pedestrian_presence, ped_rank = None, -1
+    nmt_footpath, footpath_rank = None, 3
+    school_children = vendors = peds_on_road = False
+    facilities: set[str] = set()
+    vehicle_best = {vtype: (-1, None) for vtype in _VEHICLE_TYPES}
 
-    # Highest activity level observed
-    level_order = {"high": 3, "moderate": 2, "low": 1, "none": 0, "unknown": -1}
-    activity_levels = [p.get("activity_level", "unknown") for p in profiles]
-    highest_activity = max(activity_levels, key=lambda x: level_order.get(x, -1))
-
-    # Pedestrian presence — take the highest observed
-    presence_order = {"many": 3, "some": 2, "few": 1, "none": 0}
-    ped_levels = [p.get("people_observed", {}).get("pedestrians", "none") for p in profiles]
-    pedestrian_presence = max(ped_levels, key=lambda x: presence_order.get(x, 0))
-
-    # School children — true if seen in ANY frame
-    school_children = any(
-        p.get("people_observed", {}).get("school_children", False) for p in profiles
-    )
-
-    # Vendors — true if seen in ANY frame
-    vendors = any(
-        p.get("people_observed", {}).get("vendors_roadside", False) for p in profiles
-    )
-
-    # NMT — worst case across frames
-    footpath_values = [p.get("nmt_infrastructure", {}).get("footpath", "none") for p in profiles]
-    footpath_order = {"good": 2, "poor": 1, "none": 0}
-    nmt_footpath = min(footpath_values, key=lambda x: footpath_order.get(x, 0))
-
-    # Pedestrians on carriageway — true if seen in ANY frame
-    peds_on_road = any(
-        p.get("nmt_infrastructure", {}).get("pedestrians_on_carriageway", False) for p in profiles
-    )
-
-    # Collect all unique facilities seen across frames
-    all_facilities: list[str] = []
     for p in profiles:
+        # Most common land_use across frames
+        land_uses[p.get("land_use", "unknown")] += 1
+
+        # Highest activity level observed
+        level = p.get("activity_level", "unknown")
+        rank = _LEVEL_ORDER.get(level, -1)
+        if rank > activity_rank:
+            highest_activity, activity_rank = level, rank
+
+        # Pedestrian presence — take the highest observed; school children and
+        # vendors — true if seen in ANY frame
+        people = p.get("people_observed", {})
+        level = people.get("pedestrians", "none")
+        rank = _PRESENCE_ORDER.get(level, 0)
+        if rank > ped_rank:
+            pedestrian_presence, ped_rank = level, rank
+        school_children = school_children or bool(people.get("school_children", False))
+        vendors = vendors or bool(people.get("vendors_roadside", False))
+
+        # NMT — worst case across frames; pedestrians on carriageway in ANY frame
+        nmt = p.get("nmt_infrastructure", {})
+        level = nmt.get("footpath", "none")
+        rank = _FOOTPATH_ORDER.get(level, 0)
+        if rank < footpath_rank:
+            nmt_footpath, footpath_rank = level, rank
+        peds_on_road = peds_on_road or bool(nmt.get("pedestrians_on_carriageway", False))
+
+        # All unique facilities seen across frames
         facs = p.get("facilities_visible", [])
         if isinstance(facs, list):
-            all_facilities.extend(facs)
-    facilities_seen = sorted(set(f for f in all_facilities if f != "none"))
-
-    # Vehicle mix — highest level per type across frames
-    vehicle_types = ["boda_bodas", "bicycles", "minibus_taxi", "cars", "trucks"]
-    vehicle_summary: dict[str, str] = {}
-    for vtype in vehicle_types:
-        levels = [p.get("vehicles_observed", {}).get(vtype, "none") for p in profiles]
-        highest = max(levels, key=lambda x: presence_order.get(x, 0))
-        if highest != "none":
-            vehicle_summary[vtype] = highest
+            facilities.update(facs)
+
+        # Vehicle mix — highest level per type across frames
+        vehicles = p.get("vehicles_observed", {})
+        for vtype in _VEHICLE_TYPES:
+            level = vehicles.get(vtype, "none")
+            rank = _PRESENCE_ORDER.get(level, 0)
+            if rank > vehicle_best[vtype][0]:
+                vehicle_best[vtype] = (rank, level)
+
+    dominant_land_use = land_uses.most_common(1)[0][0]
+    facilities.discard("none")
+    facilities_seen = sorted(facilities)
+    vehicle_summary: dict[str, str] = {
+        vtype: level for vtype, (_, level) in vehicle_best.items() if level != "none"
+    }
 
     # Equity concern flag
     equity_concern = "low"
@@ -117,59 +317,106 @@ def aggregate_section_equity(section_frames: list[dict]) -> dict:
     }
 
 
-def build_popup_html(frame: dict) -> str:
-    """Build HTML string for a dash-leaflet popup with dashcam thumbnail and stats.
+@lru_cache(maxsize=64)
+def _vst_to_epoch(video_start_time: str) -> float:
+    """UTC epoch seconds of a local "YYYY-MM-DD HH:MM:SS" start time (Uganda, UTC+3)."""
+    s = video_start_time
+    if len(s) == 19 and s[4] == s[7] == "-" and s[10] == " " and s[13] == s[16] == ":":
+        # Fixed-width dashcam format: slice the fields instead of strptime
+        local_dt = datetime(
+            int(s[:4]), int(s[5:7]), int(s[8:10]),
+            int(s[11:13]), int(s[14:16]), int(s[17:19]),
+            tzinfo=_TZ_LOCAL,
+        )
+    else:
+        local_dt = datetime.strptime(s, "%Y-%m-%d %H:%M:%S").replace(tzinfo=_TZ_LOCAL)
+    return local_dt.timestamp()
 
-    Args:
-        frame: assessed frame dict with assessment and image_base64 keys.
 
-    Returns:
-        HTML string for dl.Popup.
+@lru_cache(maxsize=1024, typed=True)  # typed: IRI 8 and 8.0 render differently
+def _popup_body_html(condition: str, iri, surface: str, distress: tuple, notes: str) -> str:
+    """Popup markup below the thumbnail, for one combination of assessment fields.
+
+    The thumbnail is not part of the key: it is formatted in separately, so
+    large image strings are never held by the cache.
     """
-    assessment = frame.get("assessment", {})
-    condition = assessment.get("condition_class", "fair")
-    color = CONDITION_COLORS.get(condition, "#9a6b2f")
-    iri = assessment.get("iri_estimate", "?")
-    surface = assessment.get("surface_type", "?")
-    distress = assessment.get("distress_types", [])
-    distress_str = ", ".join(d.replace("_", " ") for d in distress if d != "none") or "none"
-    notes = assessment.get("notes", "")
-    img_b64 = frame.get("image_base64", "")
-
-    parts = [
-        '<div style="font-family: \'Source Sans 3\', sans-serif; max-width: 320px;">',
-    ]
+    distress_str = ", ".join(_display_label(d) for d in distress if d != "none") or "none"
+    return _POPUP_BODY_TPL.format(
+        color=CONDITION_COLORS[condition],
+        condition=condition.upper(),
+        iri=iri,
+        surface=_title_label(surface),
+        distress=distress_str,
+        notes_block=_POPUP_NOTES_TPL.format(notes=notes) if notes else "",
+    )
 
-    if img_b64:
-        parts.append(
-            f'<img src="data:image/jpeg;base64,{img_b64}" '
-            f'style="width:300px; border-radius:3px;" />'
-        )
 
-    parts.append(
-        f'<div style="margin-top:8px;">'
-        f'<span style="background:{color}; color:white; padding:2px 8px; '
-        f'border-radius:2px; font-size:11px; font-weight:600;">'
-        f'{condition.upper()}</span>'
-        f'<span style="color:#5c5950; font-size:12px; margin-left:8px;">'
-        f'IRI ~{iri} m/km</span>'
-        f'</div>'
+def _equity_popup_html(equity: dict) -> str:
+    """Popup block flagging a high/moderate equity concern; empty otherwise.
+
+    Args:
+        equity: section equity dict from aggregate_section_equity().
+    """
+    concern = equity.get("equity_concern")
+    if concern not in ("high", "moderate"):
+        return ""
+    return _equity_block_html(
+        concern,
+        equity["dominant_land_use"],
+        equity["pedestrian_presence"],
+        bool(equity["school_children_observed"]),
+        equity["nmt_footpath"] == "none",
     )
 
-    parts.append(
-        f'<div style="font-size:12px; color:#2c2a26; margin-top:6px;">'
-        f'{surface.replace("_", " ").title()} surface &middot; {distress_str}'
-        f'</div>'
+
+@lru_cache(maxsize=256)
+def _equity_block_html(
+    concern: str, land_use: str, pedestrians: str, school_children: bool, no_footpath: bool,
+) -> str:
+    """Equity popup markup for one combination of the displayed fields."""
+    return _POPUP_EQUITY_TPL.format(
+        color="#a83a2f" if concern == "high" else "#9a6b2f",
+        concern=concern.upper(),
+        land_use=_title_label(land_use),
+        pedestrians=pedestrians,
+        school="  · School children observed" if school_children else "",
+        footpath="  · No footpath" if no_footpath else "",
     )
 
-    if notes:
-        parts.append(
-            f'<div style="font-size:11px; color:#8a8578; margin-top:4px;">'
-            f'{notes}</div>'
-        )
 
-    parts.append('</div>')
-    return "\n".join(parts)
+def build_popup_html(frame: dict, image_base64: str | None = None, equity: dict | None = None) -> str:
+    """Build HTML string for a dash-leaflet popup with dashcam thumbnail and stats.
+
+    Section features don't carry popup HTML; build it on demand (e.g. when a
+    popup is opened) from the section's representative frame, passing the
+    collection's images[str(representative_frame_index)] and the feature's
+    equity property. Nothing in the app calls it per section any more; its
+    cached blocks serve callers that open many popups on one route, where
+    sections share equity profiles and assessments.
+
+    Args:
+        frame: assessed frame dict with assessment and image_bytes (or
+            image_base64) keys.
+        image_base64: optional pre-encoded thumbnail; defaults to the frame's
+            own image.
+        equity: optional section equity dict; high/moderate concerns add an
+            equity block after the stats.
+
+    Returns:
+        HTML string for dl.Popup.
+    """
+    assessment = frame.get("assessment", {})
+    body = _popup_body_html(
+        assessment.get("condition_class", "fair"),
+        assessment.get("iri_estimate", "?"),
+        assessment.get("surface_type", "?"),
+        tuple(assessment.get("distress_types", [])),
+        assessment.get("notes", ""),
+    )
+    img_b64 = image_base64 if image_base64 is not None else frame_image_base64(frame)
+    img_block = _POPUP_IMG_TPL.format(img=img_b64) if img_b64 else ""
+    equity_block = _equity_popup_html(equity) if equity else ""
+    return _POPUP_OPEN + img_block + body + equity_block + _POPUP_CLOSE
 
 
 def frames_to_condition_geojson(
@@ -196,17 +443,17 @@ def frames_to_condition_geojson(
             for GPS coordinate densification when GPX trackpoints are unavailable.
 
     Returns:
-        GeoJSON FeatureCollection dict with LineString features.
+        GeoJSON FeatureCollection dict with LineString features, plus an
+        "images" member mapping str(representative_frame_index) to the
+        section thumbnail as base64 JPEG. Thumbnails are kept out of the
+        feature properties so split pieces share one copy.
     """
     # ------------------------------------------------------------------
     # 0.  Compute video start epoch (UTC) once, used for dense trackpoints
     # ------------------------------------------------------------------
     video_start_epoch: float | None = None
     if video_start_time is not None:
-        tz_local = timezone(timedelta(hours=3))  # Uganda = UTC+3
-        local_dt = datetime.strptime(video_start_time, "%Y-%m-%d %H:%M:%S")
-        local_dt = local_dt.replace(tzinfo=tz_local)
-        video_start_epoch = local_dt.astimezone(timezone.utc).timestamp()
+        video_start_epoch = _vst_to_epoch(video_start_time)
 
     # ------------------------------------------------------------------
     # 1.  Filter to geo-tagged assessed frames
@@ -218,7 +465,7 @@ def frames_to_condition_geojson(
     ]
 
     if not geo_frames:
-        return {"type": "FeatureCollection", "features": []}
+        return {"type": "FeatureCollection", "features": [], "images": {}}
 
     # ------------------------------------------------------------------
     # Helper: epoch time for a frame
@@ -234,10 +481,7 @@ def frames_to_condition_geojson(
         # Fall back to per-frame video_start_time field
         vst = frame.get("video_start_time")
         if vst:
-            tz_local = timezone(timedelta(hours=3))
-            local_dt = datetime.strptime(vst, "%Y-%m-%d %H:%M:%S")
-            local_dt = local_dt.replace(tzinfo=tz_local)
-            return local_dt.astimezone(timezone.utc).timestamp() + ts_sec
+            return _vst_to_epoch(vst) + ts_sec
         return None
 
     # ------------------------------------------------------------------
@@ -254,73 +498,107 @@ def frames_to_condition_geojson(
     MAX_SECTION_KM = 2.0   # maximum section length
     SMOOTHING_WINDOW = 3   # consecutive frames to confirm change
 
-    sections: list[list[dict]] = []
-    current_section = [geo_frames[0]]
-    current_condition = geo_frames[0]["assessment"]["condition_class"]
-    current_surface = geo_frames[0]["assessment"]["surface_type"]
-    section_distance_m = 0.0  # running distance in metres
-
-    for i, frame in enumerate(geo_frames[1:], 1):
-        condition = frame["assessment"]["condition_class"]
-        surface = frame["assessment"]["surface_type"]
-
-        # Distance from previous frame to this frame
-        prev = current_section[-1]
-        dist_m = haversine(prev["lat"], prev["lon"], frame["lat"], frame["lon"])
-
-        current_length_km = (section_distance_m + dist_m) / 1000
-        should_break = False
-
-        # Force break at max length
-        if current_length_km >= MAX_SECTION_KM:
-            should_break = True
-
-        # Break on surface type change (if above min length AND sustained)
-        elif current_length_km >= MIN_SECTION_KM and surface != current_surface:
-            lookahead = geo_frames[i:i + SMOOTHING_WINDOW]
-            if len(lookahead) >= SMOOTHING_WINDOW and all(
-                f["assessment"]["surface_type"] == surface for f in lookahead
-            ):
-                should_break = True
-
-        # Break on sustained condition change (if above min length)
-        elif current_length_km >= MIN_SECTION_KM and condition != current_condition:
-            # Look ahead: do the next SMOOTHING_WINDOW frames agree?
-            lookahead = geo_frames[i:i + SMOOTHING_WINDOW]
-            if len(lookahead) >= SMOOTHING_WINDOW and all(
-                f["assessment"]["condition_class"] == condition for f in lookahead
-            ):
-                should_break = True
-
-        if should_break:
-            sections.append(current_section)
-            current_section = [frame]
-            current_condition = condition
-            current_surface = surface
-            section_distance_m = 0.0
-        else:
-            current_section.append(frame)
-            section_distance_m += dist_m
-
-    sections.append(current_section)
+    # Column arrays (structure-of-arrays) — one pass over the frame dicts
+    n_frames = len(geo_frames)
+    lats = np.fromiter((f["lat"] for f in geo_frames), dtype=np.float64, count=n_frames)
+    lons = np.fromiter((f["lon"] for f in geo_frames), dtype=np.float64, count=n_frames)
+    iris = np.fromiter(
+        (f["assessment"]["iri_estimate"] for f in geo_frames), dtype=np.float64, count=n_frames,
+    )
+    conditions = [f["assessment"]["condition_class"] for f in geo_frames]
+    surfaces = [f["assessment"]["surface_type"] for f in geo_frames]
+    frame_ids = [f["frame_index"] for f in geo_frames]
+    distress_lists = [f["assessment"].get("distress_types", []) for f in geo_frames]
+
+    # Condition/surface as small integer codes, plus whether each frame starts a
+    # run of SMOOTHING_WINDOW identical values (the lookahead test, precomputed)
+    cond_ids = _codes(conditions)
+    surface_ids = _codes(surfaces)
+    cond_sustained = _sustained(cond_ids, SMOOTHING_WINDOW)
+    surface_sustained = _sustained(surface_ids, SMOOTHING_WINDOW)
+
+    # cum_m[i] = distance along the frames from frame 0 to frame i, in metres
+    step_m = haversine_vec(lats[:-1], lons[:-1], lats[1:], lons[1:])
+    cum_m = np.concatenate(([0.0], np.cumsum(step_m)))
+
+    # Sections as [start, end) index ranges into geo_frames. Each iteration
+    # jumps straight to the next break of the section starting at section_start:
+    #   - the first frame at which the section reaches MAX_SECTION_KM, or
+    #   - once past MIN_SECTION_KM, the first sustained surface change, or a
+    #     sustained condition change on an unchanged surface.
+    sections: list[tuple[int, int]] = []
+    section_start = 0
+    while True:
+        base_m = cum_m[section_start]
+        max_idx = int(np.searchsorted(cum_m, base_m + MAX_SECTION_KM * 1000, side="left"))
+        min_idx = max(
+            int(np.searchsorted(cum_m, base_m + MIN_SECTION_KM * 1000, side="left")),
+            section_start + 1,
+        )
+
+        brk = min(max_idx, n_frames)
+        if min_idx < brk:
+            window = slice(min_idx, brk)
+            surface_changed = surface_ids[window] != surface_ids[section_start]
+            condition_changed = cond_ids[window] != cond_ids[section_start]
+            breaks = (surface_changed & surface_sustained[window]) | (
+                ~surface_changed & condition_changed & cond_sustained[window]
+            )
+            hits = np.flatnonzero(breaks)
+            if hits.size:
+                brk = min_idx + int(hits[0])
+
+        if brk >= n_frames:
+            sections.append((section_start, n_frames))
+            break
+        sections.append((section_start, brk))
+        section_start = brk
+
+    # Per-section IRI mean and dominant surface, for all sections at once
+    section_starts = np.array([start for start, _ in sections], dtype=np.int64)
+    section_sizes = np.diff(np.append(section_starts, n_frames))
+    section_iris = (np.add.reduceat(iris, section_starts) / section_sizes).tolist()
+    surface_names = list(dict.fromkeys(surfaces))  # code -> value
+    section_surfaces = [surface_names[c] for c in _section_modes(surface_ids, section_starts).tolist()]
 
     # ------------------------------------------------------------------
     # 3.  Pre-compute epoch times for section boundary frames
     # ------------------------------------------------------------------
     section_epochs: list[tuple[float | None, float | None]] = []
-    for sec_frames in sections:
-        section_epochs.append((_frame_epoch(sec_frames[0]), _frame_epoch(sec_frames[-1])))
+    for start, end in sections:
+        section_epochs.append((_frame_epoch(geo_frames[start]), _frame_epoch(geo_frames[end - 1])))
+
+    # Epochs and [lon, lat] of timed GPX trackpoints, and of geo-tagged
+    # all_frames for the GPX-gap fallback, indexed once for window lookups
+    tp_index = None
+    if trackpoints:
+        timed = [tp for tp in trackpoints if tp.get("time") is not None]
+        tp_index = _time_index(
+            [tp["time"].timestamp() for tp in timed],
+            [[tp["lon"], tp["lat"]] for tp in timed],
+        )
+
+    frame_index = None
+    if all_frames:
+        located = [f for f in all_frames if f.get("lat") is not None and f.get("lon") is not None]
+        frame_index = _time_index(
+            [_frame_epoch(f) for f in located],  # None -> nan, never inside a window
+            [[f["lon"], f["lat"]] for f in located],
+        )
 
     # ------------------------------------------------------------------
     # 4.  Build GeoJSON features
     # ------------------------------------------------------------------
     features = []
-    for idx, section_frames in enumerate(sections):
-        condition = section_frames[0]["assessment"]["condition_class"]
-        color = CONDITION_COLORS.get(condition, "#9a6b2f")
+    feature_seg_km: list[np.ndarray] = []  # per-feature segment lengths, reused in step 5
+    images: dict[str, str] = {}  # str(frame_index) -> base64 JPEG thumbnail
+    for idx, (start, end) in enumerate(sections):
+        section_frames = geo_frames[start:end]
+        condition = conditions[start]
+        color = CONDITION_COLORS[condition]
 
         # --- Dense LineString coordinates from trackpoints ---------------
-        coords: list[list[float]] | None = None
+        coords: list | None = None  # (lon, lat) pairs
 
         # Compute time window for this section (midpoints with neighbors)
         window_start: float | None = None
@@ -342,80 +620,52 @@ def frames_to_condition_geojson(
                 window_end = ((last_ep or first_ep) + next_first) / 2.0 if next_first is not None else (last_ep or first_ep) + 30.0
 
         # Try GPX trackpoints first (densest, follows actual road)
-        if trackpoints and window_start is not None:
-            dense = get_trackpoints_between(trackpoints, window_start, window_end)
-            if dense:
-                coords = dense
+        if tp_index is not None and window_start is not None:
+            dense = _points_between(tp_index, window_start, window_end)
+            if len(dense):
+                coords = _lonlat_pairs(dense)
 
         # Fallback: use all_frames' GPS in the time window (for GPX gaps)
-        if not coords and all_frames and window_start is not None:
-            frame_coords = []
-            for f in all_frames:
-                if f.get("lat") is None or f.get("lon") is None:
-                    continue
-                ep = _frame_epoch(f)
-                if ep is not None and window_start <= ep <= window_end:
-                    frame_coords.append([f["lon"], f["lat"]])
+        if not coords and frame_index is not None and window_start is not None:
+            frame_coords = _points_between(frame_index, window_start, window_end)
             if len(frame_coords) >= 2:
-                coords = frame_coords
+                coords = _lonlat_pairs(frame_coords)
 
         # Last fallback: section's own assessed frame GPS points
         if not coords:
-            coords = [[f["lon"], f["lat"]] for f in section_frames]
+            coords = list(zip(lons[start:end].tolist(), lats[start:end].tolist()))
 
         # Single-point section: duplicate with tiny offset for valid LineString
         if len(coords) == 1:
             lon, lat = coords[0]
-            coords.append([lon + 0.00005, lat + 0.00005])
+            coords.append((lon + 0.00005, lat + 0.00005))
 
         # --- Section-level statistics ------------------------------------
-        iris = [f["assessment"]["iri_estimate"] for f in section_frames]
-        avg_iri = round(sum(iris) / len(iris), 1) if iris else 0
+        avg_iri = round(section_iris[idx], 1)
+        surface_type = section_surfaces[idx]
 
-        surfaces = [f["assessment"]["surface_type"] for f in section_frames]
-        surface_type = Counter(surfaces).most_common(1)[0][0] if surfaces else "unknown"
+        all_distress = frozenset(chain.from_iterable(distress_lists[start:end])) - {"none"}
 
-        all_distress: set[str] = set()
-        for f in section_frames:
-            for d in f["assessment"].get("distress_types", []):
-                if d != "none":
-                    all_distress.add(d)
-
-        frame_indices = [f["frame_index"] for f in section_frames]
+        frame_indices = frame_ids[start:end]
         rep_idx = len(section_frames) // 2
         rep_frame = section_frames[rep_idx]
 
         # --- Equity aggregation -----------------------------------------------
         equity = aggregate_section_equity(section_frames)
 
-        popup_html = build_popup_html(rep_frame)
-
-        # Add equity info to popup for high/moderate concern sections
-        if equity["equity_concern"] in ("high", "moderate"):
-            equity_color = "#a83a2f" if equity["equity_concern"] == "high" else "#9a6b2f"
-            popup_html = popup_html.replace(
-                '</div>\n</div>',  # before closing tags
-                f'<div style="margin-top:6px;padding:4px 8px;background:{equity_color}15;'
-                f'border-left:3px solid {equity_color};font-size:11px;">'
-                f'<b style="color:{equity_color}">Equity: {equity["equity_concern"].upper()}</b><br>'
-                f'{equity["dominant_land_use"].replace("_", " ").title()} area · '
-                f'Pedestrians: {equity["pedestrian_presence"]}'
-                f'{"  · School children observed" if equity["school_children_observed"] else ""}'
-                f'{"  · No footpath" if equity["nmt_footpath"] == "none" else ""}'
-                f'</div>\n</div>\n</div>',
-                1,  # only first occurrence
-            )
+        # Base64-encode only the representative frame of each section, once,
+        # into the collection-level images map rather than the properties
+        rep_key = str(rep_frame["frame_index"])
+        if rep_key not in images:
+            rep_image = frame_image_base64(rep_frame)
+            if rep_image:
+                images[rep_key] = rep_image
 
         # Notes from representative frame
         notes = rep_frame["assessment"].get("notes", "")
 
-        # Store representative image for Dash component popups
-        rep_image = rep_frame.get("image_base64", "")
-
-        linestring_length_km_val = sum(
-            haversine(coords[i-1][1], coords[i-1][0], coords[i][1], coords[i][0])
-            for i in range(1, len(coords))
-        ) / 1000
+        seg_km = _segment_km(coords)
+        linestring_length_km_val = float(seg_km.sum())
 
         feature = {
             "type": "Feature",
@@ -429,19 +679,18 @@ def frames_to_condition_geojson(
                 "weight": 6,
                 "avg_iri": avg_iri,
                 "surface_type": surface_type,
-                "distress_types": ", ".join(sorted(all_distress)) if all_distress else "none",
+                "distress_types": _distress_label(all_distress),
                 "notes": notes,
                 "length_km": round(linestring_length_km_val, 2),
                 "section_index": idx,
                 "frame_indices": frame_indices,
                 "representative_frame_index": rep_frame["frame_index"],
-                "representative_image": rep_image,
-                "popup_html": popup_html,
                 "equity": equity,
                 "equity_concern": equity["equity_concern"],
             },
         }
         features.append(feature)
+        feature_seg_km.append(seg_km)
 
     # ------------------------------------------------------------------
     # 5.  Post-process: split sections exceeding MAX_SECTION_KM
@@ -449,77 +698,34 @@ def frames_to_condition_geojson(
     split_limit = MAX_SECTION_KM * 1.5  # 1.5 km hard ceiling
     DENSIFY_RESOLUTION_KM = 0.25  # ensure enough points for any section >500m
 
-    def _densify_coords(coords: list[list[float]]) -> list[list[float]]:
-        """Insert intermediate points so no segment exceeds DENSIFY_RESOLUTION_KM."""
-        dense = [coords[0]]
-        for i in range(1, len(coords)):
-            seg_km = haversine(coords[i - 1][1], coords[i - 1][0],
-                               coords[i][1], coords[i][0]) / 1000
-            if seg_km > DENSIFY_RESOLUTION_KM:
-                n_parts = max(2, int(seg_km / DENSIFY_RESOLUTION_KM) + 1)
-                for j in range(1, n_parts):
-                    frac = j / n_parts
-                    dense.append([
-                        coords[i - 1][0] + frac * (coords[i][0] - coords[i - 1][0]),
-                        coords[i - 1][1] + frac * (coords[i][1] - coords[i - 1][1]),
-                    ])
-            dense.append(coords[i])
-        return dense
-
     final_features = []
-    for feat in features:
-        coords = _densify_coords(feat["geometry"]["coordinates"])
-        feat["geometry"]["coordinates"] = coords
-
-        total_km = 0.0
-        for i in range(1, len(coords)):
-            total_km += haversine(coords[i - 1][1], coords[i - 1][0],
-                                  coords[i][1], coords[i][0]) / 1000
-
-        if total_km <= split_limit:
+    for feat, seg_km in zip(features, feature_seg_km):
+        coords = feat["geometry"]["coordinates"]
+        if (seg_km > DENSIFY_RESOLUTION_KM).any():
+            dense = _densify_kernel(np.asarray(coords, dtype=np.float64), seg_km, DENSIFY_RESOLUTION_KM)
+            coords = _lonlat_pairs(dense)
+            seg_km = _segment_km(dense)
+            feat["geometry"]["coordinates"] = coords
+
+        if sum(seg_km.tolist()) <= split_limit:
             final_features.append(feat)
-        else:
-
-            # Split at MAX_SECTION_KM intervals
-            sub_coords = [coords[0]]
-            sub_dist = 0.0
-            for i in range(1, len(coords)):
-                seg_km = haversine(coords[i - 1][1], coords[i - 1][0],
-                                   coords[i][1], coords[i][0]) / 1000
-                if sub_dist + seg_km > MAX_SECTION_KM and len(sub_coords) >= 2:
-                    sub_length_km = sum(
-                        haversine(sub_coords[j-1][1], sub_coords[j-1][0],
-                                  sub_coords[j][1], sub_coords[j][0])
-                        for j in range(1, len(sub_coords))
-                    ) / 1000
-                    new_feat = {
-                        "type": "Feature",
-                        "geometry": {"type": "LineString", "coordinates": list(sub_coords)},
-                        "properties": {**dict(feat["properties"]), "length_km": round(sub_length_km, 2)},
-                    }
-                    final_features.append(new_feat)
-                    sub_coords = [coords[i - 1]]  # overlap at boundary
-                    sub_dist = 0.0
-                sub_coords.append(coords[i])
-                sub_dist += seg_km
-            if len(sub_coords) >= 2:
-                sub_length_km = sum(
-                    haversine(sub_coords[j-1][1], sub_coords[j-1][0],
-                              sub_coords[j][1], sub_coords[j][0])
-                    for j in range(1, len(sub_coords))
-                ) / 1000
-                new_feat = {
-                    "type": "Feature",
-                    "geometry": {"type": "LineString", "coordinates": list(sub_coords)},
-                    "properties": {**dict(feat["properties"]), "length_km": round(sub_length_km, 2)},
-                }
-                final_features.append(new_feat)
+            continue
+
+        # Split at MAX_SECTION_KM intervals; pieces overlap at their boundary point
+        for i0, i1, piece_km in _split_kernel(seg_km, MAX_SECTION_KM):
+            props = feat["properties"].copy()
+            props["length_km"] = round(piece_km, 2)
+            final_features.append({
+                "type": "Feature",
+                "geometry": {"type": "LineString", "coordinates": coords[i0:i1]},
+                "properties": props,
+            })
 
     # Re-index section_index sequentially
     for i, feat in enumerate(final_features):
         feat["properties"]["section_index"] = i
 
-    return {"type": "FeatureCollection", "features": final_features}
+    return {"type": "FeatureCollection", "features": final_features, "images": images}
 
 
 def frames_to_geojson(assessed_frames: list[dict]) -> dict:
@@ -531,7 +737,7 @@ def frames_to_geojson(assessed_frames: list[dict]) -> dict:
     for frame in assessed_frames:
         assessment = frame.get("assessment", {})
         condition = assessment.get("condition_class", "fair")
-        color = CONDITION_COLORS.get(condition, "#9a6b2f")
+        color = CONDITION_COLORS[condition]
 
         lat = frame.get("lat")
         lon = frame.get("lon")
@@ -589,9 +795,9 @@ def build_condition_summary_panel(summary: dict, total_distance_km: float = 0.0)
     }
 
 
-def generate_condition_narrative(summary: dict, anthropic_client, model: str = "claude-sonnet-4-5-20250929") -> str:
-    """Send summary stats to Claude, get a 2-3 paragraph condition narrative."""
-    prompt = f"""You are a road engineer writing a condition assessment for a road appraisal report.
+def _condition_narrative_prompt(summary: dict) -> str:
+    """Prompt asking for a condition narrative from pipeline summary stats."""
+    return f"""You are a road engineer writing a condition assessment for a road appraisal report.
 
 Based on this dashcam analysis data, write a 2-3 paragraph professional road condition narrative suitable for inclusion in an investment appraisal report.
 
@@ -605,6 +811,11 @@ Data:
 
 Write in third person, past tense. Be specific about the data. Do not use markdown headings."""
 
+
+def generate_condition_narrative(summary: dict, anthropic_client, model: str = "claude-sonnet-4-5-20250929") -> str:
+    """Send summary stats to Claude, get a 2-3 paragraph condition narrative."""
+    prompt = _condition_narrative_prompt(summary)
+
     try:
         response = anthropic_client.messages.create(
             model=model,
@@ -617,6 +828,47 @@ Write in third person, past tense. Be specific about the data. Do not use markdo
         return generate_condition_narrative_mock(summary)
 
 
+async def generate_condition_narrative_async(
+    summary: dict, anthropic_client, model: str = "claude-sonnet-4-5-20250929",
+) -> str:
+    """Async generate_condition_narrative, for an anthropic.AsyncAnthropic client."""
+    prompt = _condition_narrative_prompt(summary)
+
+    try:
+        response = await anthropic_client.messages.create(
+            model=model,
+            max_tokens=500,
+            messages=[{"role": "user", "content": prompt}],
+        )
+        return response.content[0].text.strip()
+    except Exception as e:
+        print(f"  Narrative generation error: {e}")
+        return generate_condition_narrative_mock(summary)
+
+
+def generate_condition_narratives_bulk(
+    summaries: list[dict], anthropic_client, model: str = "claude-sonnet-4-5-20250929",
+) -> list[str]:
+    """Generate narratives for several pipeline summaries concurrently.
+
+    Args:
+        summaries: pipeline summary dicts, e.g. one per video in an appraisal.
+        anthropic_client: an anthropic.AsyncAnthropic client.
+        model: model name passed to each request.
+
+    Returns:
+        Narratives in the same order as summaries. Failed requests fall back
+        to generate_condition_narrative_mock, as in the sync version.
+    """
+    async def _gather() -> list[str]:
+        return await asyncio.gather(*(
+            generate_condition_narrative_async(summary, anthropic_client, model=model)
+            for summary in summaries
+        ))
+
+    return asyncio.run(_gather())
+
+
 def generate_condition_narrative_mock(summary: dict) -> str:
     """Return a mock narrative for testing without API."""
     avg_iri = summary.get("average_iri", 8.0)
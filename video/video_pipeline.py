@@ -1,14 +1,25 @@
 """TARA dashcam video analysis pipeline — orchestrator."""
 
-import copy
 import hashlib
 import json
+import logging
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 
+import numpy as np
+
+from video.file_io import read_json, write_json, write_text
 from video.video_frames import extract_frames, extract_start_time_from_filename
-from video.gps_utils import parse_gpx_folder, match_frames_to_gps, haversine
+from video.gps_utils import (
+    parse_gpx_folder,
+    match_frames_to_gps,
+    build_track_index,
+    haversine_vec,
+    polyline_length_km,
+)
 from video.vision_assess import assess_road
 from video.video_map import (
     frames_to_geojson,
@@ -20,9 +31,18 @@ from video.video_map import (
 from video.intervention import recommend_interventions_for_route
 from video.equity import generate_equity_narrative, generate_equity_narrative_mock
 
+logger = logging.getLogger(__name__)
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_OUTPUT_DIR = os.path.join(_BASE_DIR, "output")
+
 
 # ── Cache helpers ──────────────────────────────────────────────────
 
+VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
+_FINGERPRINT_BYTES = 64 * 1024  # size of each block hashed from an input file
+_FINGERPRINT_BLOCKS = 8  # blocks hashed per file: first, last and evenly spaced between
+
 
 def _get_cache_dir(video_path: str) -> str:
     """Get cache directory for a video dataset."""
@@ -37,24 +57,109 @@ def _get_cache_dir(video_path: str) -> str:
     return os.path.join(parent, "cache")
 
 
+def _input_files(path: str, extensions: tuple[str, ...]) -> list[str]:
+    """The file at path, or the files in directory path with the given extensions."""
+    if os.path.isfile(path):
+        return [path]
+    if os.path.isdir(path):
+        return sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.lower().endswith(extensions)
+        )
+    return []
+
+
+def _file_fingerprint(path: str) -> tuple[int, str]:
+    """(size, digest) of a file, hashing _FINGERPRINT_BLOCKS blocks spread across it.
+
+    Files up to that many blocks long are hashed in full; for larger files
+    the blocks run from the first to the last 64 KB at even spacing.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        last = max(0, size - _FINGERPRINT_BYTES)
+        if size <= _FINGERPRINT_BYTES * _FINGERPRINT_BLOCKS:
+            digest.update(f.read())
+        else:
+            for i in range(_FINGERPRINT_BLOCKS):
+                f.seek(last * i // (_FINGERPRINT_BLOCKS - 1))
+                digest.update(f.read(_FINGERPRINT_BYTES))
+    return size, digest.hexdigest()
+
+
 def _get_cache_path(video_path: str, gpx_path: str, frame_interval_meters: int) -> str:
-    """Cache key includes paths and frame interval."""
+    """Cache key from the content of the input videos and GPX files plus the frame interval.
+
+    Each input file contributes its size and a hash of 64 KB blocks sampled
+    across it (see _file_fingerprint), so a moved or copied dataset still
+    hits its cache and a replaced or re-encoded clip misses it. Files are
+    not hashed in full: an edit that keeps the size and falls between the
+    sampled blocks is not detected (the app's Re-analyse button covers that).
+    Caches written under the older path-based key are no longer read.
+    """
     cache_dir = _get_cache_dir(video_path)
-    key = f"{video_path}:{gpx_path}:{frame_interval_meters}"
-    h = hashlib.md5(key.encode()).hexdigest()[:12]
-    return os.path.join(cache_dir, f"pipeline_{h}.json")
+    digest = hashlib.blake2b(digest_size=6)
+    for files in (_input_files(video_path, VIDEO_EXTENSIONS), _input_files(gpx_path, (".gpx",))):
+        digest.update(repr([_file_fingerprint(p) for p in files]).encode())
+    digest.update(str(frame_interval_meters).encode())
+    return os.path.join(cache_dir, f"pipeline_{digest.hexdigest()}.json")
 
 
 def _strip_base64_for_cache(result: dict) -> dict:
-    """Remove large base64 image data from result before caching."""
-    cached = copy.deepcopy(result)
+    """Remove large image data (raw JPEG bytes / base64) from result before caching.
+
+    Only the result dict, the frames list and the frames carrying image data
+    are copied; everything else is shared with result, which is not modified.
+    """
+    cached = dict(result)
     if "frames" in cached:
+        frames = []
         for frame in cached["frames"]:
-            if "image_base64" in frame:
+            if "image_bytes" in frame or "image_base64" in frame:
+                frame = {k: v for k, v in frame.items() if k != "image_bytes"}
                 frame["image_base64"] = "[cached]"
+            frames.append(frame)
+        cached["frames"] = frames
     return cached
 
 
+# ── GPX parsing ────────────────────────────────────────────────────
+
+
+@lru_cache(maxsize=8)
+def _parse_gpx_cached(gpx_path: str, signature: tuple) -> list[dict]:
+    """parse_gpx_folder memoised on (path, file signature); see _load_trackpoints."""
+    return parse_gpx_folder(gpx_path)
+
+
+def _load_trackpoints(gpx_path: str) -> list[dict]:
+    """parse_gpx_folder, reusing the previous parse while the GPX files are unchanged.
+
+    The signature is each GPX file's path, size and mtime, so editing, adding
+    or removing a file reparses. Returns a fresh list; the trackpoint dicts
+    are shared with the cache and must not be modified.
+    """
+    signature = tuple(
+        (p, st.st_size, st.st_mtime_ns)
+        for p in _input_files(gpx_path, (".gpx",))
+        for st in (os.stat(p),)
+    )
+    return list(_parse_gpx_cached(gpx_path, signature))
+
+
+# ── API client ─────────────────────────────────────────────────────
+
+VISION_MAX_RETRIES = 5  # SDK-level retries (with backoff) for rate limits and transient errors
+
+
+@lru_cache(maxsize=4)
+def _get_anthropic(api_key: str | None):
+    """Anthropic client per API key, reused across pipeline runs (import and connection pool)."""
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key, max_retries=VISION_MAX_RETRIES)
+
+
 # ── Distance-based frame selection ─────────────────────────────────
 
 
@@ -76,18 +181,21 @@ def _select_frames_by_distance(
     if not geo_frames:
         return matched_frames  # fallback to all frames
 
-    selected = [geo_frames[0]]
-    cumulative = 0.0
-
-    for i in range(1, len(geo_frames)):
-        prev = geo_frames[i - 1]
-        curr = geo_frames[i]
-        dist = haversine(prev["lat"], prev["lon"], curr["lat"], curr["lon"])
-        cumulative += dist
+    # cum_m[i] = distance along the frames from frame 0 to frame i, in metres
+    n = len(geo_frames)
+    lats = np.fromiter((f["lat"] for f in geo_frames), dtype=np.float64, count=n)
+    lons = np.fromiter((f["lon"] for f in geo_frames), dtype=np.float64, count=n)
+    cum_m = np.concatenate(([0.0], np.cumsum(haversine_vec(lats[:-1], lons[:-1], lats[1:], lons[1:]))))
 
-        if cumulative >= interval_meters:
-            selected.append(curr)
-            cumulative = 0.0
+    # Greedy walk: from each selected frame, jump to the first frame at least
+    # interval_meters further along
+    selected = [geo_frames[0]]
+    i = 0
+    while True:
+        i = max(int(np.searchsorted(cum_m, cum_m[i] + interval_meters, side="left")), i + 1)
+        if i >= n:
+            break
+        selected.append(geo_frames[i])
 
     # Always include last frame
     if selected[-1] is not geo_frames[-1]:
@@ -98,7 +206,6 @@ def _select_frames_by_distance(
 
 # ── Main pipeline ──────────────────────────────────────────────────
 
-
 def run_pipeline(
     video_path: str,
     gpx_path: str,
@@ -111,6 +218,9 @@ def run_pipeline(
     progress_callback=None,
     skip_size_guards: bool = False,
     use_cache: bool = True,
+    assess_concurrency: int = 8,
+    assess_batch: bool = False,
+    output_dir: str = _OUTPUT_DIR,
 ) -> dict:
     """Run the full dashcam analysis pipeline.
 
@@ -130,20 +240,44 @@ def run_pipeline(
         progress_callback: optional callable(stage: int, message: str)
             for reporting progress to the UI.
         skip_size_guards: if True, skip size/count validation (for testing).
-        use_cache: if True, check for and save cached results.
+        use_cache: if True, check for and save cached results, including
+            per-frame vision assessments.
+        assess_concurrency: vision requests in flight at once during
+            assessment (1 sends them one by one with a delay between).
+        assess_batch: if True, submit vision requests through the Message
+            Batches API (half price, no realtime progress) for unattended runs.
+        output_dir: directory the condition GeoJSON, narrative and summary
+            are written to.
 
     Returns dict with frames, summary, geojson, narrative, metadata.
+    metadata["stage_seconds"] holds the wall time spent in each step (validate,
+    extract_frames, load_gpx, match_gps, assess, build_map, interventions,
+    narratives, write_outputs).
+
+    Stage output goes to the "video.video_pipeline" logger: progress and
+    results at INFO, step timings at DEBUG, recoverable failures at WARNING.
     """
 
     # --- Progress helper ---
     def progress(stage: int, message: str):
         if progress_callback:
             progress_callback(stage, message)
-        print(message)
+        logger.info("%s", message)
 
     t0 = time.time()
+
+    # --- Step timer: each call records the time since the previous one ---
+    stage_seconds: dict[str, float] = {}
+    step_started = time.perf_counter()
+
+    def step_done(name: str):
+        nonlocal step_started
+        now = time.perf_counter()
+        stage_seconds[name] = round(now - step_started, 2)
+        logger.debug("Step %s took %.2fs", name, now - step_started)
+        step_started = now
+
     is_dir = os.path.isdir(video_path)
-    VIDEO_EXTENSIONS = (".mp4", ".avi", ".mov")
     MAX_TOTAL_SIZE = 2 * 1024 * 1024 * 1024  # 2 GB
     MAX_PER_CLIP_SIZE = 100 * 1024 * 1024  # 100 MB
     MAX_CLIP_COUNT = 100
@@ -157,8 +291,7 @@ def run_pipeline(
             cache_path = _get_cache_path(video_path, gpx_path, effective_interval_meters)
             if os.path.exists(cache_path):
                 progress(1, "Loading cached results...")
-                with open(cache_path, "r") as f:
-                    cached_result = json.load(f)
+                cached_result = read_json(cache_path)
                 # Backfill equity_narrative for caches from before equity integration
                 if "equity_narrative" not in cached_result:
                     section_features = cached_result.get("geojson", {}).get("features", [])
@@ -167,7 +300,7 @@ def run_pipeline(
                 progress(7, f"Loaded from cache — {sections_count} sections")
                 return cached_result
         except Exception as e:
-            print(f"  Cache read failed, running pipeline: {e}")
+            logger.warning("  Cache read failed, running pipeline: %s", e)
 
     # ── SIZE GUARDS ──────────────────────────────────────────────────
     warnings = []
@@ -175,14 +308,15 @@ def run_pipeline(
     n_clips = 1
 
     if is_dir:
-        video_files = sorted(
-            f for f in os.listdir(video_path)
-            if f.lower().endswith(VIDEO_EXTENSIONS)
-        )
+        # One directory scan: clip names and sizes for the guards and extraction
+        with os.scandir(video_path) as it:
+            clip_sizes = dict(sorted(
+                (e.name, e.stat().st_size) for e in it
+                if e.name.lower().endswith(VIDEO_EXTENSIONS)
+            ))
+        video_files = list(clip_sizes)
         clip_count_check = len(video_files)
-        total_size = sum(
-            os.path.getsize(os.path.join(video_path, f)) for f in video_files
-        )
+        total_size = sum(clip_sizes.values())
         size_mb = total_size / (1024 ** 2)
         n_clips = clip_count_check
 
@@ -203,8 +337,7 @@ def run_pipeline(
                 }
 
             # Per-clip size check
-            for vf in video_files:
-                fsize = os.path.getsize(os.path.join(video_path, vf))
+            for vf, fsize in clip_sizes.items():
                 if fsize > MAX_PER_CLIP_SIZE:
                     size_mb_clip = fsize / (1024 ** 2)
                     warnings.append(
@@ -232,50 +365,52 @@ def run_pipeline(
                 }
 
     progress(1, f"Validating uploads... (checking {n_clips} clips, {size_mb:.0f}MB total)")
+    step_done("validate")
 
     # ── MAIN PIPELINE (wrapped for memory safety) ────────────────────
     try:
-        print("\n[TARA Video Pipeline]")
-        print("\u2500" * 21)
+        logger.info("[TARA Video Pipeline]")
         if is_dir:
-            mp4_count = len([f for f in os.listdir(video_path) if f.lower().endswith(VIDEO_EXTENSIONS)])
-            print(f"Mode: Multi-clip ({mp4_count} files)")
+            logger.info("Mode: Multi-clip (%d files)", len(video_files))
         else:
-            print(f"Mode: Single file")
+            logger.info("Mode: Single file")
 
         # --- Stage 2: Extract frames ---
         if is_dir:
-            mp4_files = sorted(
-                f for f in os.listdir(video_path)
-                if f.lower().endswith(VIDEO_EXTENSIONS)
-            )
-            for i, mp4 in enumerate(mp4_files):
-                progress(2, f"Extracting frames... (clip {i + 1}/{len(mp4_files)} — {mp4})")
+            for i, mp4 in enumerate(video_files):
+                progress(2, f"Extracting frames... (clip {i + 1}/{len(video_files)} — {mp4})")
         else:
             progress(2, f"Extracting frames... (clip 1/1 — {os.path.basename(video_path)})")
 
-        frames = extract_frames(video_path, interval_seconds=frame_interval)
+        # GPX parsing touches different files: run it while frames are extracted
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            gpx_future = pool.submit(_load_trackpoints, gpx_path)
+            frames = extract_frames(video_path, interval_seconds=frame_interval)
+            step_done("extract_frames")
         if frames:
             duration_min = frames[-1]["timestamp_sec"] / 60
         else:
             duration_min = 0
-        clip_count = len(set(f.get("clip_filename", "") for f in frames))
-        print(f"  \u2192 Extracted {len(frames)} frames from {clip_count} clip(s) "
-              f"(every {frame_interval}s, {duration_min:.1f} min total)")
+        # Frames grouped by clip (one pass), for the clip count and per-clip GPS matching
+        clips = {}
+        for f in frames:
+            clips.setdefault(f.get("clip_filename", ""), []).append(f)
+        clip_count = len(clips)
+        logger.info("  \u2192 Extracted %d frames from %d clip(s) (every %ss, %.1f min total)",
+                    len(frames), clip_count, frame_interval, duration_min)
 
         # --- Stage 3: Parse GPS & match ---
-        trackpoints = parse_gpx_folder(gpx_path)
-        total_dist_m = 0.0
-        for i in range(1, len(trackpoints)):
-            total_dist_m += haversine(
-                trackpoints[i - 1]["lat"], trackpoints[i - 1]["lon"],
-                trackpoints[i]["lat"], trackpoints[i]["lon"],
-            )
-        total_dist_km = total_dist_m / 1000
+        trackpoints = gpx_future.result()
+        total_dist_km = polyline_length_km(
+            [tp["lat"] for tp in trackpoints], [tp["lon"] for tp in trackpoints],
+        )
         tp_duration = 0.0
         if len(trackpoints) >= 2 and trackpoints[0]["time"] and trackpoints[-1]["time"]:
             tp_duration = (trackpoints[-1]["time"] - trackpoints[0]["time"]).total_seconds() / 60
-        print(f"  \u2192 {len(trackpoints)} trackpoints over {tp_duration:.1f} minutes, {total_dist_km:.2f} km")
+        logger.info("  \u2192 %d trackpoints over %.1f minutes, %.2f km",
+                    len(trackpoints), tp_duration, total_dist_km)
+        # Time still spent on the GPX after extraction finished
+        step_done("load_gpx")
 
         progress(3, f"Matching GPS coordinates... ({len(frames)} frames \u2192 {len(trackpoints)} trackpoints)")
 
@@ -285,34 +420,28 @@ def run_pipeline(
             auto_time = extract_start_time_from_filename(first_clip)
             if auto_time:
                 video_start_time = auto_time
-                print(f"  Auto-detected start time from filename: {video_start_time}")
+                logger.info("  Auto-detected start time from filename: %s", video_start_time)
 
         # For multi-clip, match per-clip using each clip's own start time
-        clips = {}
-        for f in frames:
-            clips.setdefault(f.get("clip_filename", ""), []).append(f)
-
         if len(clips) > 1:
-            # Per-clip GPS matching
+            # Per-clip GPS matching, against a trackpoint index built once
+            track_index = build_track_index(trackpoints)
             for clip_filename, clip_frames in clips.items():
                 clip_start = clip_frames[0].get("video_start_time")
                 if clip_start is None:
                     clip_start = video_start_time
-                # Temporarily reset timestamps to clip-local for matching
-                original_ts = [f["timestamp_sec"] for f in clip_frames]
-                base_ts = clip_frames[0]["timestamp_sec"]
-                for f in clip_frames:
-                    f["timestamp_sec"] = f["timestamp_sec"] - base_ts
-                match_frames_to_gps(clip_frames, trackpoints, video_start_time=clip_start)
-                # Restore cumulative timestamps
-                for f, orig_ts in zip(clip_frames, original_ts):
-                    f["timestamp_sec"] = orig_ts
+                # Match on clip-local time; cumulative timestamps stay untouched
+                match_frames_to_gps(
+                    clip_frames, trackpoints, video_start_time=clip_start,
+                    time_offset_sec=clip_frames[0]["timestamp_sec"], track_index=track_index,
+                )
         else:
             # Single clip — use the standard matching
             frames = match_frames_to_gps(frames, trackpoints, video_start_time=video_start_time)
 
         geo_count = sum(1 for f in frames if f.get("lat") is not None)
-        print(f"  \u2192 {geo_count} frames geo-tagged")
+        logger.info("  \u2192 %d frames geo-tagged", geo_count)
+        step_done("match_gps")
 
         # --- Stage 4: Assess road condition ---
         # Distance-based frame selection (new) vs legacy time-based
@@ -321,8 +450,8 @@ def run_pipeline(
                 frames, interval_meters=frame_interval_meters,
             )
             n_to_assess = len(frames_for_vision)
-            print(f"  \u2192 Distance-based selection: {n_to_assess} frames "
-                  f"at {frame_interval_meters}m spacing")
+            logger.info("  \u2192 Distance-based selection: %d frames at %sm spacing",
+                        n_to_assess, frame_interval_meters)
         else:
             frames_for_vision = frames
             n_to_assess = min(len(frames), max_frames)
@@ -331,8 +460,8 @@ def run_pipeline(
 
         anthropic_client = None
         if not use_mock:
-            from anthropic import Anthropic
-            anthropic_client = Anthropic(api_key=api_key or os.environ.get("ANTHROPIC_API_KEY"))
+            resolved_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
+            anthropic_client = _get_anthropic(resolved_key)
 
         vision_max = None if use_distance_mode else max_frames
         result = assess_road(
@@ -340,40 +469,62 @@ def run_pipeline(
             anthropic_client=anthropic_client,
             max_frames=vision_max,
             use_mock=use_mock,
+            concurrency=assess_concurrency,
+            use_batch=assess_batch,
+            cache_dir=os.path.join(_get_cache_dir(video_path), "assessments") if use_cache else None,
         )
         assessed_frames = result["frames"]
         summary = result["summary"]
+        step_done("assess")
 
         # --- Stage 5: Generate outputs ---
         n_sections = summary.get("total_frames_assessed", 0)
         progress(5, f"Building condition map... ({n_sections} assessed, {total_dist_km:.1f}km)")
 
-        geojson = frames_to_condition_geojson(
-            assessed_frames,
-            trackpoints=trackpoints,
-            video_start_time=video_start_time,
-            all_frames=frames,
-        )
-        print(f"  \u2192 GeoJSON with {len(geojson['features'])} sections")
-        point_geojson = frames_to_geojson(assessed_frames)
-        panel_data = build_condition_summary_panel(summary, total_distance_km=total_dist_km)
-
-        # --- Stage 6: Recommend interventions ---
-        progress(6, "Recommending interventions...")
-
-        section_props = [feat["properties"] for feat in geojson["features"]]
-        interventions = recommend_interventions_for_route(section_props)
-        route_summary = interventions.get("route_summary", {})
-        total_intervention_cost = route_summary.get("total_cost", 0)
-        print(f"  \u2192 {len(interventions['sections'])} sections, "
-              f"est. cost ${total_intervention_cost:,.0f}")
-
-        # Generate narratives
-        if use_mock:
-            narrative = generate_condition_narrative_mock(summary)
-        else:
-            narrative = generate_condition_narrative(summary, anthropic_client)
-        print("  \u2192 Condition narrative generated")
+        # The condition narrative only needs the summary: request it while the
+        # map and interventions are built
+        narrative_pool = ThreadPoolExecutor(max_workers=1)
+        try:
+            narrative_future = None
+            if not use_mock:
+                narrative_future = narrative_pool.submit(generate_condition_narrative, summary, anthropic_client)
+
+            # Both map builders skip frames without a position; filter them once
+            geo_assessed = [
+                f for f in assessed_frames
+                if f.get("lat") is not None and f.get("lon") is not None
+            ]
+            geojson = frames_to_condition_geojson(
+                geo_assessed,
+                trackpoints=trackpoints,
+                video_start_time=video_start_time,
+                all_frames=frames,
+            )
+            logger.info("  \u2192 GeoJSON with %d sections", len(geojson["features"]))
+            point_geojson = frames_to_geojson(geo_assessed)
+            panel_data = build_condition_summary_panel(summary, total_distance_km=total_dist_km)
+            step_done("build_map")
+
+            # --- Stage 6: Recommend interventions ---
+            progress(6, "Recommending interventions...")
+
+            section_props = [feat["properties"] for feat in geojson["features"]]
+            interventions = recommend_interventions_for_route(section_props)
+            route_summary = interventions.get("route_summary", {})
+            total_intervention_cost = route_summary.get("total_cost", 0)
+            logger.info("  \u2192 %d sections, est. cost $%s",
+                        len(interventions["sections"]), f"{total_intervention_cost:,.0f}")
+            step_done("interventions")
+
+            # Generate narratives
+            if narrative_future is None:
+                narrative = generate_condition_narrative_mock(summary)
+            else:
+                narrative = narrative_future.result()
+        finally:
+            # If a later step failed, don't hold the error up for the request
+            narrative_pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("  \u2192 Condition narrative generated")
 
         # Generate equity narrative from section-level camera observations
         section_features = geojson.get("features", [])
@@ -382,21 +533,25 @@ def run_pipeline(
                 equity_narrative = generate_equity_narrative_mock(section_features)
             else:
                 equity_narrative = generate_equity_narrative(section_features, anthropic_client)
-            print("  \u2192 Equity narrative generated")
+            logger.info("  \u2192 Equity narrative generated")
         except Exception as e:
-            print(f"  Equity narrative generation failed: {e}")
+            logger.warning("  Equity narrative generation failed: %s", e)
             equity_narrative = generate_equity_narrative_mock(section_features)
+        step_done("narratives")
 
         # Save outputs
-        output_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "output")
         os.makedirs(output_dir, exist_ok=True)
 
-        with open(os.path.join(output_dir, "condition.geojson"), "w") as f:
-            json.dump(geojson, f, indent=2)
-        with open(os.path.join(output_dir, "narrative.md"), "w") as f:
-            f.write(narrative)
-        with open(os.path.join(output_dir, "summary.json"), "w") as f:
-            json.dump(summary, f, indent=2)
+        # Independent files: write them concurrently, re-raising any write error
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            writes = [
+                pool.submit(write_json, os.path.join(output_dir, "condition.geojson"), geojson, indent=True),
+                pool.submit(write_text, os.path.join(output_dir, "narrative.md"), narrative),
+                pool.submit(write_json, os.path.join(output_dir, "summary.json"), summary, indent=True),
+            ]
+        for write in writes:
+            write.result()
+        step_done("write_outputs")
 
         elapsed = time.time() - t0
 
@@ -437,6 +592,7 @@ def run_pipeline(
                 "total_distance_km": round(total_dist_km, 2),
                 "sections_count": n_sections_final,
                 "processing_time_seconds": round(elapsed, 1),
+                "stage_seconds": stage_seconds,
                 "model_used": "claude-opus-4-6",
                 "gpx_trackpoints": len(trackpoints),
                 "timestamp": datetime.now().isoformat(),
@@ -453,11 +609,10 @@ def run_pipeline(
                 os.makedirs(cache_dir, exist_ok=True)
                 cache_path = _get_cache_path(video_path, gpx_path, effective_interval_meters)
                 cache_result = _strip_base64_for_cache(result_dict)
-                with open(cache_path, "w") as f:
-                    json.dump(cache_result, f)
-                print(f"  \u2192 Cache saved to {cache_path}")
+                write_json(cache_path, cache_result)
+                logger.info("  \u2192 Cache saved to %s", cache_path)
             except Exception as e:
-                print(f"  Warning: Could not save cache: {e}")
+                logger.warning("  Warning: Could not save cache: %s", e)
 
         return result_dict
 
@@ -471,13 +626,23 @@ def run_pipeline(
 if __name__ == "__main__":
     import sys
 
-    base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-    video_dir = os.path.join(base, "data", "videos")
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    video_dir = os.path.join(_BASE_DIR, "data", "videos")
 
     # Check if directory has MP4s, otherwise fall back to single file
     if os.path.isdir(video_dir):
-        mp4s = sorted(f for f in os.listdir(video_dir) if f.lower().endswith(".mp4"))
-        gpxs = sorted(f for f in os.listdir(video_dir) if f.lower().endswith(".gpx"))
+        # One directory pass for both lists; sorted since the first of each is used
+        mp4s, gpxs = [], []
+        with os.scandir(video_dir) as it:
+            for entry in it:
+                lower = entry.name.lower()
+                if lower.endswith(".mp4"):
+                    mp4s.append(entry.name)
+                elif lower.endswith(".gpx"):
+                    gpxs.append(entry.name)
+        mp4s.sort()
+        gpxs.sort()
     else:
         mp4s, gpxs = [], []
 
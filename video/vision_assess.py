@@ -1,10 +1,21 @@
 """Claude Vision road condition assessment."""
 
+import asyncio
 import base64
+import copy
+import hashlib
 import json
+import os
 import random
 import re
 import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from video.file_io import loads_json, write_json
+from video.video_frames import frame_image_bytes
 
 
 VISION_PROMPT = """You are a road condition assessment expert analysing dashcam footage from Uganda.
@@ -24,6 +35,9 @@ Activity profile guidance:
 - facilities_visible: List ALL facility types you can see or identify from signs. Include shops, market_stalls, school, church, mosque, health_facility, fuel_station. Report "none" if no facilities visible.
 - nmt_infrastructure: Is there a footpath/sidewalk alongside the road? Is the road shoulder wide and smooth enough for pedestrians to walk on safely? Are pedestrians walking ON the carriageway (the road surface where vehicles drive)?"""
 
+# Changes whenever VISION_PROMPT does, invalidating cached assessments
+_PROMPT_DIGEST = hashlib.blake2b(VISION_PROMPT.encode(), digest_size=8).hexdigest()
+
 DEFAULT_ASSESSMENT = {
     "surface_type": "unknown",
     "condition_class": "fair",
@@ -43,61 +57,297 @@ DEFAULT_ASSESSMENT = {
 }
 
 
+# Longest image edge sent to the vision model. Claude downscales anything
+# larger server-side, so bigger images only cost upload time
+VISION_MAX_EDGE = 1568
+
+
+# Markdown code fence around a JSON reply
+_FENCE_HEAD = re.compile(r'^```(?:json)?\s*')
+_FENCE_TAIL = re.compile(r'\s*```$')
+
+
+def _default_assessment() -> dict:
+    """A fresh copy of DEFAULT_ASSESSMENT, nested dicts included, safe to mutate."""
+    return copy.deepcopy(DEFAULT_ASSESSMENT)
+
+
+# JPEG start-of-frame markers (SOF0-SOF15 less DHT, JPG and DAC), which
+# carry the image size; markers without a length segment
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+_JPEG_STANDALONE_MARKERS = frozenset(range(0xD0, 0xDA)) | {0x01}
+
+
+def _jpeg_size(data: bytes) -> tuple[int, int] | None:
+    """(width, height) read from a JPEG's frame header, or None if not found."""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker in _JPEG_STANDALONE_MARKERS:
+            i += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            return int.from_bytes(data[i + 7:i + 9], "big"), int.from_bytes(data[i + 5:i + 7], "big")
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _fit_for_vision(image_bytes: bytes) -> bytes:
+    """Downscale a JPEG to VISION_MAX_EDGE if it is larger, else return it as-is.
+
+    The size comes from the JPEG header, so frames already within the limit
+    (the usual case) are never decoded.
+    """
+    size = _jpeg_size(image_bytes)
+    if not image_bytes or (size is not None and max(size) <= VISION_MAX_EDGE):
+        return image_bytes
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return image_bytes
+    h, w = image.shape[:2]
+    scale = VISION_MAX_EDGE / max(h, w)
+    if scale >= 1:
+        return image_bytes
+    image = cv2.resize(image, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA)
+    _, buf = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return buf.tobytes()
+
+
+def _vision_messages(image_bytes: bytes) -> list[dict]:
+    """Messages payload for one frame's vision request; the only base64 encode."""
+    image_base64 = base64.b64encode(_fit_for_vision(image_bytes)).decode("ascii")
+    return [{
+        "role": "user",
+        "content": [
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": "image/jpeg",
+                    "data": image_base64,
+                },
+            },
+            {"type": "text", "text": VISION_PROMPT},
+        ],
+    }]
+
+
+def _parse_assessment(response) -> dict:
+    """Assessment dict from a vision response; raises json.JSONDecodeError on bad JSON."""
+    text = response.content[0].text.strip()
+    try:
+        result = loads_json(text)
+    except json.JSONDecodeError:
+        # Strip markdown code blocks if present
+        text = _FENCE_HEAD.sub('', text)
+        text = _FENCE_TAIL.sub('', text)
+        result = loads_json(text)
+    # Ensure activity_profile has safe defaults
+    if "activity_profile" not in result:
+        result["activity_profile"] = copy.deepcopy(DEFAULT_ASSESSMENT["activity_profile"])
+    return result
+
+
 def assess_frame(image_base64: str, anthropic_client, model: str = "claude-opus-4-6") -> dict:
     """Send one frame to Claude Vision, get condition assessment."""
-    for attempt in range(2):
+    return _assess_jpeg(base64.b64decode(image_base64), anthropic_client, model)
+
+
+async def assess_frame_async(image_base64: str, anthropic_client, model: str = "claude-opus-4-6") -> dict:
+    """Async assess_frame, for an anthropic.AsyncAnthropic client."""
+    return await _assess_jpeg_async(base64.b64decode(image_base64), anthropic_client, model)
+
+
+def _assess_jpeg(image_bytes: bytes, anthropic_client, model: str) -> dict:
+    """assess_frame on raw JPEG bytes, as carried by extracted frames."""
+    messages = _vision_messages(image_bytes)
+    for _ in range(2):
         try:
             response = anthropic_client.messages.create(
                 model=model,
                 max_tokens=600,
-                messages=[{
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": image_base64,
-                            },
-                        },
-                        {"type": "text", "text": VISION_PROMPT},
-                    ],
-                }],
+                messages=messages,
+            )
+        except Exception as e:
+            # The SDK has already retried rate limits, timeouts and 5xx with
+            # backoff (client max_retries); re-sending at once would not help
+            print(f"  Vision API error: {e}")
+            return _default_assessment()
+        try:
+            return _parse_assessment(response)
+        except (json.JSONDecodeError, IndexError, AttributeError, TypeError):
+            # Malformed or empty reply: ask once more
+            continue
+    return _default_assessment()
+
+
+async def _assess_jpeg_async(image_bytes: bytes, anthropic_client, model: str) -> dict:
+    """Async _assess_jpeg, for an anthropic.AsyncAnthropic client."""
+    messages = _vision_messages(image_bytes)
+    for _ in range(2):
+        try:
+            response = await anthropic_client.messages.create(
+                model=model,
+                max_tokens=600,
+                messages=messages,
             )
-            text = response.content[0].text.strip()
-            # Strip markdown code blocks if present
-            text = re.sub(r'^```(?:json)?\s*', '', text)
-            text = re.sub(r'\s*```$', '', text)
-            result = json.loads(text)
-            # Ensure activity_profile has safe defaults
-            result.setdefault("activity_profile", DEFAULT_ASSESSMENT["activity_profile"])
-            return result
-        except json.JSONDecodeError:
-            if attempt == 0:
-                continue
-            return dict(DEFAULT_ASSESSMENT)
         except Exception as e:
-            if attempt == 0:
-                continue
             print(f"  Vision API error: {e}")
-            return dict(DEFAULT_ASSESSMENT)
+            return _default_assessment()
+        try:
+            return _parse_assessment(response)
+        except (json.JSONDecodeError, IndexError, AttributeError, TypeError):
+            continue
+    return _default_assessment()
+
+
+def _assessment_cache_path(cache_dir: str, image_bytes: bytes, model: str) -> str:
+    """Cache file for one frame's assessment, keyed on JPEG bytes, model and prompt."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{model}\0{_PROMPT_DIGEST}\0".encode())
+    digest.update(image_bytes)
+    return os.path.join(cache_dir, f"{digest.hexdigest()}.json")
+
+
+def _read_cached_assessment(path: str) -> dict | None:
+    """Cached assessment at path, or None if missing or unreadable."""
+    try:
+        with open(path) as f:
+            return loads_json(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def _assess_frames_concurrently(
+    frames: list[dict], anthropic_client, model: str, concurrency: int,
+) -> list[dict]:
+    """Assess frames with at most *concurrency* requests in flight; results in frame order.
+
+    Requests go through an AsyncAnthropic client with anthropic_client's
+    credentials, endpoint, timeout and retries. It is opened and closed
+    inside the event loop, which owns its connections.
+    """
+    from anthropic import AsyncAnthropic
+
+    async def _gather() -> list[dict]:
+        semaphore = asyncio.Semaphore(concurrency)
+        async with AsyncAnthropic(
+            api_key=anthropic_client.api_key,
+            auth_token=anthropic_client.auth_token,
+            base_url=anthropic_client.base_url,
+            timeout=anthropic_client.timeout,
+            max_retries=anthropic_client.max_retries,
+        ) as async_client:
+
+            async def _one(frame: dict) -> dict:
+                async with semaphore:
+                    return await _assess_jpeg_async(frame_image_bytes(frame), async_client, model)
+
+            return await asyncio.gather(*(_one(frame) for frame in frames))
+
+    return asyncio.run(_gather())
+
+
+# Frames per Message Batches submission (keeps each batch well under the API's size cap)
+BATCH_MAX_FRAMES = 500
+# Batch status polling: first wait, doubling up to the cap
+BATCH_POLL_START_SEC = 5.0
+BATCH_POLL_MAX_SEC = 60.0
+
+
+def _assess_frames_batch(
+    frames: list[dict], anthropic_client, model: str,
+) -> list[dict]:
+    """Assess frames through the Message Batches API; results in frame order.
+
+    Batches are processed asynchronously at half the per-request price, so
+    this suits runs where nobody is waiting on the result. Status is polled
+    with exponential backoff, so small batches that finish quickly are
+    picked up within seconds. Frames whose request fails or returns bad
+    JSON get DEFAULT_ASSESSMENT.
+    """
+    batch_ids = []
+    for start in range(0, len(frames), BATCH_MAX_FRAMES):
+        batch = anthropic_client.messages.batches.create(requests=[
+            {
+                "custom_id": f"frame_{i}",
+                "params": {
+                    "model": model,
+                    "max_tokens": 600,
+                    "messages": _vision_messages(frame_image_bytes(frame)),
+                },
+            }
+            for i, frame in enumerate(frames[start:start + BATCH_MAX_FRAMES], start)
+        ])
+        batch_ids.append(batch.id)
+        print(f"    Submitted batch {batch.id} ({min(len(frames) - start, BATCH_MAX_FRAMES)} frames)")
+
+    assessments = [None] * len(frames)
+    for batch_id in batch_ids:
+        wait = BATCH_POLL_START_SEC
+        reported = None
+        while True:
+            batch = anthropic_client.messages.batches.retrieve(batch_id)
+            if batch.processing_status == "ended":
+                break
+            counts = batch.request_counts
+            done = counts.succeeded + counts.errored + counts.canceled + counts.expired
+            if done != reported:
+                print(f"    Batch {batch_id}: {done}/{done + counts.processing} requests done")
+                reported = done
+            time.sleep(wait)
+            wait = min(wait * 2, BATCH_POLL_MAX_SEC)
+        for entry in anthropic_client.messages.batches.results(batch_id):
+            i = int(entry.custom_id.removeprefix("frame_"))
+            if entry.result.type != "succeeded":
+                print(f"  Vision batch request {entry.custom_id} {entry.result.type}")
+                continue
+            try:
+                assessments[i] = _parse_assessment(entry.result.message)
+            except (json.JSONDecodeError, IndexError, AttributeError, TypeError):
+                pass
+    return [a if a is not None else _default_assessment() for a in assessments]
 
 
 _MOCK_COUNTER = 0
 
 # Deterministic cycling sequences for reproducible testing
-_MOCK_CONDITIONS = ["good", "good", "fair", "fair", "poor", "good", "good", "fair", "poor", "bad"]
+_MOCK_CONDITIONS = ("good", "good", "fair", "fair", "poor", "good", "good", "fair", "poor", "bad")
 _MOCK_IRI_RANGES = {"good": (3, 5), "fair": (6, 9), "poor": (10, 14), "bad": (15, 20)}
-_MOCK_SURFACES = ["paved_asphalt", "paved_asphalt", "gravel", "earth"]
-_MOCK_NOTES = [
+_MOCK_SURFACES = ("paved_asphalt", "paved_asphalt", "gravel", "earth")
+_MOCK_NOTES = (
     "Tarmac in fair condition with edge erosion",
     "Paved surface with patching and minor cracks",
     "Gravel road with corrugation visible",
     "Laterite surface with moderate potholing",
     "Road under active construction with earthworks",
     "Earth road with deep ruts after rain",
-]
+)
+_MOCK_DISTRESS = ["pothole", "cracking", "rutting", "edge_break", "patching", "raveling", "corrugation", "erosion"]
+_MOCK_SEVERITIES = ("none", "low", "moderate", "high", "severe")
+_MOCK_ENVIRONMENTS = ("urban", "peri_urban", "rural")
+
+# Mock activity profile — cycling through realistic Uganda scenarios
+_MOCK_LAND_USE = ("trading_centre", "residential", "agricultural", "mixed", "residential", "trading_centre")
+_MOCK_ACTIVITY = ("high", "moderate", "low", "moderate", "high", "low")
+_MOCK_PEDESTRIANS = ("many", "some", "few", "none", "some", "many")
+_MOCK_BODA_BODAS = ("many", "some", "few", "many", "some", "few")
+_MOCK_FOOTPATHS = ("none", "poor", "none", "good", "poor", "none")
+_MOCK_FACILITIES = (
+    ("shops", "market_stalls"),
+    ("none",),
+    ("none",),
+    ("school", "church"),
+    ("shops",),
+    ("health_facility", "shops"),
+)
 
 
 def assess_frame_mock(image_base64: str) -> dict:
@@ -112,49 +362,31 @@ def assess_frame_mock(image_base64: str) -> dict:
     # Deterministic IRI within range
     iri = round(lo + (hi - lo) * ((idx % 7) / 6), 1)
 
-    distress_pool = ["pothole", "cracking", "rutting", "edge_break", "patching", "raveling", "corrugation", "erosion"]
     n_distress = idx % 3
-    distress = distress_pool[idx % len(distress_pool): idx % len(distress_pool) + n_distress] or ["none"]
-
-    severity_cycle = ["none", "low", "moderate", "high", "severe"]
-    env_cycle = ["urban", "peri_urban", "rural"]
-
-    # Mock activity profile — cycling through realistic Uganda scenarios
-    land_use_cycle = ["trading_centre", "residential", "agricultural", "mixed", "residential", "trading_centre"]
-    activity_cycle = ["high", "moderate", "low", "moderate", "high", "low"]
-    ped_cycle = ["many", "some", "few", "none", "some", "many"]
-    boda_cycle = ["many", "some", "few", "many", "some", "few"]
-    footpath_cycle = ["none", "poor", "none", "good", "poor", "none"]
-    facilities_cycle = [
-        ["shops", "market_stalls"],
-        ["none"],
-        ["none"],
-        ["school", "church"],
-        ["shops"],
-        ["health_facility", "shops"],
-    ]
+    distress = _MOCK_DISTRESS[idx % len(_MOCK_DISTRESS): idx % len(_MOCK_DISTRESS) + n_distress] or ["none"]
+    footpath = _MOCK_FOOTPATHS[idx % len(_MOCK_FOOTPATHS)]
 
     activity_profile = {
-        "land_use": land_use_cycle[idx % len(land_use_cycle)],
-        "activity_level": activity_cycle[idx % len(activity_cycle)],
+        "land_use": _MOCK_LAND_USE[idx % len(_MOCK_LAND_USE)],
+        "activity_level": _MOCK_ACTIVITY[idx % len(_MOCK_ACTIVITY)],
         "people_observed": {
-            "pedestrians": ped_cycle[idx % len(ped_cycle)],
+            "pedestrians": _MOCK_PEDESTRIANS[idx % len(_MOCK_PEDESTRIANS)],
             "school_children": idx % 5 == 3,
             "vendors_roadside": idx % 3 == 0,
             "people_carrying_loads": idx % 4 == 1,
         },
         "vehicles_observed": {
-            "boda_bodas": boda_cycle[idx % len(boda_cycle)],
-            "bicycles": ped_cycle[(idx + 2) % len(ped_cycle)],
+            "boda_bodas": _MOCK_BODA_BODAS[idx % len(_MOCK_BODA_BODAS)],
+            "bicycles": _MOCK_PEDESTRIANS[(idx + 2) % len(_MOCK_PEDESTRIANS)],
             "minibus_taxi": "some" if idx % 3 == 0 else "few",
             "cars": "some" if idx % 2 == 0 else "few",
             "trucks": "few" if idx % 4 != 0 else "some",
         },
-        "facilities_visible": facilities_cycle[idx % len(facilities_cycle)],
+        "facilities_visible": list(_MOCK_FACILITIES[idx % len(_MOCK_FACILITIES)]),
         "nmt_infrastructure": {
-            "footpath": footpath_cycle[idx % len(footpath_cycle)],
+            "footpath": footpath,
             "shoulder_usable": idx % 3 == 2,
-            "pedestrians_on_carriageway": footpath_cycle[idx % len(footpath_cycle)] == "none",
+            "pedestrians_on_carriageway": footpath == "none",
         },
     }
 
@@ -163,8 +395,8 @@ def assess_frame_mock(image_base64: str) -> dict:
         "condition_class": condition,
         "iri_estimate": iri,
         "distress_types": distress,
-        "distress_severity": severity_cycle[idx % len(severity_cycle)],
-        "roadside_environment": env_cycle[idx % len(env_cycle)],
+        "distress_severity": _MOCK_SEVERITIES[idx % len(_MOCK_SEVERITIES)],
+        "roadside_environment": _MOCK_ENVIRONMENTS[idx % len(_MOCK_ENVIRONMENTS)],
         "notes": _MOCK_NOTES[idx % len(_MOCK_NOTES)],
         "activity_profile": activity_profile,
     }
@@ -177,50 +409,115 @@ def assess_road(
     delay: float = 1.0,
     use_mock: bool = False,
     model: str = "claude-opus-4-6",
+    concurrency: int = 1,
+    cache_dir: str = None,
+    use_batch: bool = False,
 ) -> dict:
-    """Assess all (or sampled) frames. Returns results dict with frames and summary."""
+    """Assess all (or sampled) frames. Returns results dict with frames and summary.
+
+    anthropic_client is an anthropic.Anthropic. With concurrency > 1, up to
+    that many requests run at once over an async client opened with the
+    same settings, and *delay* is not applied. With use_batch, frames go
+    through the Message Batches API instead (half price, but results can
+    take minutes to hours); concurrency is ignored.
+
+    With cache_dir, each API assessment is stored there keyed on the frame's
+    JPEG, the model and the prompt, and frames seen before are not sent
+    again. Failed assessments (DEFAULT_ASSESSMENT) are not cached; mock runs
+    don't use the cache. Within a run, byte-identical frames are assessed
+    once whether or not cache_dir is set.
+    """
     frames = list(frames_with_gps)
 
     # Sample evenly if max_frames is set
     if max_frames and len(frames) > max_frames:
-        step = len(frames) / max_frames
-        indices = [int(i * step) for i in range(max_frames)]
-        frames = [frames[i] for i in indices]
+        # Evenly spaced, first and last frame included
+        indices = np.linspace(0, len(frames) - 1, max_frames, dtype=np.int64)
+        frames = [frames[i] for i in indices.tolist()]
 
     total = len(frames)
-    for i, frame in enumerate(frames):
-        if use_mock:
-            assessment = assess_frame_mock(frame["image_base64"])
+    assessments: list[dict | None] = [None] * total
+    cache_paths = None
+    if cache_dir and not use_mock:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            print(f"    Warning: Could not create assessment cache: {e}")
         else:
-            assessment = assess_frame(frame["image_base64"], anthropic_client, model=model)
-            if i < total - 1:
+            cache_paths = [_assessment_cache_path(cache_dir, frame_image_bytes(f), model) for f in frames]
+            assessments = [_read_cached_assessment(path) for path in cache_paths]
+    pending = [i for i, a in enumerate(assessments) if a is None]
+    if cache_paths is not None and len(pending) < total:
+        print(f"    {total - len(pending)}/{total} assessments loaded from cache")
+
+    # Byte-identical images (e.g. a parked vehicle) are sent once; each
+    # repeat maps to the first pending frame with the same image
+    same_as: dict[int, int] = {}
+    if not use_mock:
+        first_by_image: dict = {}
+        for i in pending:
+            key = cache_paths[i] if cache_paths is not None else hashlib.blake2b(
+                frame_image_bytes(frames[i]), digest_size=16,
+            ).digest()
+            same_as[i] = first_by_image.setdefault(key, i)
+        same_as = {i: first for i, first in same_as.items() if first != i}
+    to_send = [i for i in pending if i not in same_as]
+
+    fresh = None
+    if not use_mock and to_send:
+        if use_batch:
+            fresh = _assess_frames_batch([frames[i] for i in to_send], anthropic_client, model)
+        elif concurrency > 1:
+            fresh = _assess_frames_concurrently([frames[i] for i in to_send], anthropic_client, model, concurrency)
+    if fresh is not None:
+        for i, assessment in zip(to_send, fresh):
+            assessments[i] = assessment
+
+    for i, frame in enumerate(frames):
+        assessment = assessments[i]
+        if assessment is None and i in same_as:
+            assessment = copy.deepcopy(assessments[same_as[i]])
+        elif assessment is None and use_mock:
+            assessment = assess_frame_mock("")  # the mock ignores the image
+        elif assessment is None:
+            assessment = _assess_jpeg(frame_image_bytes(frame), anthropic_client, model)
+            if i != to_send[-1]:
                 time.sleep(delay)
+        assessments[i] = assessment
 
         frame["assessment"] = assessment
         cond = assessment["condition_class"]
         iri = assessment["iri_estimate"]
         print(f"    Assessing frame {i + 1}/{total}... [{cond}, IRI ~{iri}]")
 
-    # Build summary
-    conditions = [f["assessment"]["condition_class"] for f in frames]
-    iris = [f["assessment"]["iri_estimate"] for f in frames]
-    surfaces = [f["assessment"]["surface_type"] for f in frames]
+    if cache_paths is not None:
+        # A cache that can't be written only costs the next run API calls
+        try:
+            for i in to_send:
+                if frames[i]["assessment"] != DEFAULT_ASSESSMENT:
+                    write_json(cache_paths[i], frames[i]["assessment"])
+        except OSError as e:
+            print(f"    Warning: Could not save assessment cache: {e}")
+
+    # Build summary in one pass over the assessments
+    condition_counts = Counter()
+    surface_counts = Counter()
+    iri_total = 0
     all_distress = set()
     for f in frames:
-        for d in f["assessment"]["distress_types"]:
-            if d != "none":
-                all_distress.add(d)
-
-    from collections import Counter
-    condition_counts = dict(Counter(conditions))
-    surface_counts = Counter(surfaces)
+        a = f["assessment"]
+        condition_counts[a["condition_class"]] += 1
+        surface_counts[a["surface_type"]] += 1
+        iri_total += a["iri_estimate"]
+        all_distress.update(a["distress_types"])
+    all_distress.discard("none")
 
     summary = {
         "total_frames_assessed": total,
-        "condition_distribution": condition_counts,
-        "average_iri": round(sum(iris) / len(iris), 1) if iris else 0,
+        "condition_distribution": dict(condition_counts),
+        "average_iri": round(iri_total / total, 1) if total else 0,
         "dominant_surface": surface_counts.most_common(1)[0][0] if surface_counts else "unknown",
-        "dominant_condition": Counter(conditions).most_common(1)[0][0] if conditions else "unknown",
+        "dominant_condition": condition_counts.most_common(1)[0][0] if condition_counts else "unknown",
         "distress_types_found": sorted(all_distress),
     }
 